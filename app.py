@@ -1,10 +1,31 @@
 import streamlit as st
 import requests
-from datetime import datetime, date
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+from datetime import datetime, date, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from collections import Counter, OrderedDict
+import math
+import sys
+import uuid
+import threading
+import time
 import os
+import json
+import logging
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, replace
+import altair as alt
+import numpy as np
+import pandas as pd
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
+from availability import AvailabilityIndex, VectorAvailability, clashing_reservations, join_bookings, location_interval
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 # Configuración de la página
 st.set_page_config(
@@ -39,510 +60,2256 @@ except:
         st.error("❌ No se encontró NOTION_TOKEN. Configura st.secrets o el archivo .env")
         st.stop()
 NOTION_VERSION = "2022-06-28"
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com/v1")
 DEVICES_ID = "43e15b677c8c4bd599d7c602f281f1da"
 LOCATIONS_ID = "28758a35e4118045abe6e37534c44974"
 
-headers = {
-    "Authorization": f"Bearer {NOTION_TOKEN}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
+# Tiempo (segundos) que el inventario de Notion se comparte en memoria entre sesiones
+INVENTORY_TTL = int(os.getenv("INVENTORY_TTL", "300"))
+
+# Cada cuánto (segundos) se recarga el inventario completo en vez de solo los cambios
+FULL_SYNC_INTERVAL = int(os.getenv("FULL_SYNC_INTERVAL", "3600"))
+
+# Motor de disponibilidad: "index" (árbol de intervalos) o "vector" (NumPy, consultas en bloque)
+AVAILABILITY_ENGINE = os.getenv("AVAILABILITY_ENGINE", "index")
+
+# Límite de peticiones por segundo a la API de Notion (~3 de media)
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))
+
+# Peticiones simultáneas al asignar dispositivos en bloque
+ASSIGN_WORKERS = int(os.getenv("ASSIGN_WORKERS", "4"))
+
+# Conexiones keep-alive reutilizables con Notion y timeouts (conexión, lectura) en segundos
+NOTION_POOL_SIZE = int(os.getenv("NOTION_POOL_SIZE", "10"))
+NOTION_TIMEOUT = (5, 30)
+
+# Copia en disco del inventario para arrancar rápido y servir datos si Notion falla ("" = desactivada)
+SNAPSHOT_PATH = os.getenv("INVENTORY_SNAPSHOT_PATH", ".cache/inventory.sqlite")
+
+# Tras un error de Notion, segundos sirviendo la copia guardada antes de reintentar
+ERROR_RETRY_INTERVAL = 60
+
+# Dispositivos por página en el selector de resultados
+DEVICES_PER_PAGE = 25
+
+# Resultados de consulta (fechas distintas) que se guardan en memoria, compartidos entre sesiones
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "32"))
+
+# Semanas que puede abarcar el calendario de disponibilidad
+CALENDAR_MAX_WEEKS = 13
+
+# Días hacia delante en los que se busca la primera fecha con unidades libres
+WINDOW_SEARCH_DAYS = 365
+
+# Cola de asignaciones en disco (los trabajos sobreviven a un reinicio del proceso)
+JOBS_PATH = os.getenv("ASSIGNMENT_JOBS_PATH", ".cache/jobs.sqlite")
+JOB_BATCH_SIZE = 20
+JOB_MAX_ATTEMPTS = 5
+JOB_POLL_INTERVAL = 1
+JOB_LEASE = 120
+JOB_RETENTION = 7 * 24 * 3600
+
+# Cada cuántos segundos se refresca el estado de los trabajos en curso
+JOB_STATUS_INTERVAL = 2
+
+headers = {
+    "Authorization": f"Bearer {NOTION_TOKEN}",
+    "Content-Type": "application/json",
+    "Notion-Version": NOTION_VERSION,
+}
+
+
+class TokenBucket:
+    """Limitador de ritmo (token bucket) compartido por todas las llamadas a Notion"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Espera hasta que haya un token disponible y lo consume"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            time.sleep(wait)
+
+
+class RetryableResponse(Exception):
+    """Respuesta 429/5xx de Notion que merece reintentarse"""
+    
+    def __init__(self, response):
+        super().__init__(f"{response.status_code}: {response.text}")
+        self.response = response
+
+
+def wait_for_retry(retry_state):
+    """Respeta la cabecera Retry-After de Notion; si no viene, backoff exponencial"""
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, RetryableResponse):
+        try:
+            return float(exc.response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            pass
+    return wait_exponential(multiplier=0.5, max=8)(retry_state)
+
+
+def give_up_retrying(retry_state):
+    """Tras el último intento, devuelve la respuesta de error (o relanza la excepción de red)"""
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, RetryableResponse):
+        return exc.response
+    raise exc
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución (las demás esperan su resultado)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+    
+    def in_flight(self, key):
+        return key in self.calls
+    
+    def do(self, key, fn, *args):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+class NotionClient:
+    """Cliente único para la API de Notion: sesión keep-alive, límite de ritmo, reintentos y lecturas agrupadas"""
+    
+    def __init__(self, base_url, headers, rate_limit, pool_size, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate_limit, rate_limit)
+        self.flights = SingleFlight()
+        
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    @retry(
+        retry=retry_if_exception_type((RetryableResponse, requests.ConnectionError, requests.Timeout)),
+        wait=wait_for_retry,
+        stop=stop_after_attempt(5),
+        retry_error_callback=give_up_retrying,
+    )
+    def request(self, method, path, **kwargs):
+        """Petición a Notion respetando el límite de ritmo y reintentando 429/5xx"""
+        response = self.send(method, path, **kwargs)
+        
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableResponse(response)
+        
+        return response
+    
+    @retry(
+        retry=retry_if_exception_type(RetryableResponse),
+        wait=wait_for_retry,
+        stop=stop_after_attempt(5),
+        retry_error_callback=give_up_retrying,
+    )
+    def create_page(self, payload):
+        """Crea una página: solo reintenta los 429 (los 5xx y errores de red pudieron crearla; decide quien llama)"""
+        response = self.send("POST", "pages", json=payload)
+        
+        if response.status_code == 429:
+            raise RetryableResponse(response)
+        
+        return response
+    
+    def send(self, method, path, **kwargs):
+        """Un solo intento, respetando el límite de ritmo"""
+        self.rate_limiter.acquire()
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, f"{self.base_url}/{path}", **kwargs)
+
+
+@st.cache_resource
+def get_notion_client():
+    """Cliente único por proceso, compartido entre reruns y sesiones"""
+    return NotionClient(NOTION_API_URL, headers, NOTION_RATE_LIMIT, NOTION_POOL_SIZE, NOTION_TIMEOUT)
+
+
+# Se obtiene aquí, en el hilo del script, para que los hilos de trabajo no tengan que tocar st.*
+notion = get_notion_client()
+
+
+def with_properties(path, property_ids=None):
+    """Añade filter_properties a una ruta si solo se quieren algunas propiedades"""
+    # Notion ya devuelve los IDs codificados para URL: quote con safe="%" no vuelve a codificar los %XX
+    if property_ids is not None:
+        path += "?" + "&".join(f"filter_properties={quote(property_id, safe='%')}" for property_id in property_ids)
+    return path
+
+
+def query_path(database_id, property_ids=None):
+    """Ruta de la consulta de una base de datos (ver with_properties)"""
+    return with_properties(f"databases/{database_id}/query", property_ids)
+
+
+def fetch_json(method, path, payload=None):
+    """Lectura de Notion ya decodificada (de solo lectura: se comparte entre llamadas idénticas)"""
+    response = notion.request(method, path, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+def read_notion(method, path, payload=None):
+    """Lectura de Notion; si otra sesión está haciendo la misma, espera y comparte su resultado"""
+    key = (method, path, json.dumps(payload, sort_keys=True))
+    return notion.flights.do(key, fetch_json, method, path, payload)
+
+
+def query_database(database_id, payload, property_ids=None):
+    """Lanza una consulta (un lote de hasta 100 páginas) contra Notion"""
+    return read_notion("POST", query_path(database_id, property_ids), payload)
+
+
+def get_property_ids(database_id):
+    """IDs de las propiedades de una base de datos, por nombre (para filter_properties)"""
+    data = read_notion("GET", f"databases/{database_id}")
+    return {name: prop["id"] for name, prop in data["properties"].items()}
+
+
+def iter_page_batches(database_id, payload=None, property_ids=None):
+    """Generador de los lotes de páginas de una base de datos, siguiendo el cursor de paginación"""
+    payload = {**(payload or {}), "page_size": 100}
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(query_database, database_id, payload, property_ids)
+        
+        while pending is not None:
+            data = pending.result()
+            
+            # Pedir el siguiente lote antes de entregar el actual
+            next_cursor = data.get("next_cursor")
+            if data.get("has_more") and next_cursor:
+                pending = executor.submit(
+                    query_database, database_id, {**payload, "start_cursor": next_cursor}, property_ids
+                )
+            else:
+                pending = None
+            
+            yield data.get("results", [])
+
+
+def read_relation(page_id, property_id):
+    """IDs de todas las páginas de una relación, por el endpoint de propiedades (paginado)"""
+    path = f"pages/{page_id}/properties/{quote(property_id, safe='%')}?page_size=100"
+    related_ids = []
+    cursor = None
+    
+    while True:
+        data = read_notion("GET", f"{path}&start_cursor={cursor}" if cursor else path)
+        related_ids += [item["relation"]["id"] for item in data["results"]]
+        cursor = data.get("next_cursor")
+        if not (data.get("has_more") and cursor):
+            return related_ids
+
+
+def complete_relations(pages):
+    """Completa las relaciones que Notion devolvió cortadas (solo incluye 25 elementos y has_more)"""
+    for page in pages:
+        for prop in page["properties"].values():
+            if prop.get("type") == "relation" and prop.get("has_more"):
+                prop["relation"] = [{"id": related_id} for related_id in read_relation(page["id"], prop["id"])]
+                prop["has_more"] = False
+
+
+class TagTable:
+    """Códigos enteros de las etiquetas de los devices (uno por etiqueta distinta)"""
+    
+    def __init__(self):
+        self.names = []
+        self.codes = {}
+        self.lock = threading.Lock()
+    
+    def code(self, name):
+        """Código de una etiqueta (se le asigna uno nuevo la primera vez que aparece)"""
+        code = self.codes.get(name)
+        if code is None:
+            with self.lock:
+                code = self.codes.setdefault(name, len(self.names))
+                if code == len(self.names):
+                    self.names.append(name)
+        return code
+    
+    def name(self, code):
+        return self.names[code]
+
+
+@st.cache_resource
+def get_tag_table():
+    """Tabla de etiquetas del proceso (los registros guardan solo el código)"""
+    return TagTable()
+
+
+tag_table = get_tag_table()
+
+
+@dataclass(slots=True, frozen=True)
+class Device:
+    """Registro compacto de un device, de solo lectura y compartido entre sesiones (las reservas salen de join_bookings)"""
+    id: str
+    name: str
+    tag_code: int
+    location_ids: tuple[str, ...]
+    
+    @property
+    def tag(self):
+        return tag_table.name(self.tag_code)
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Crea el registro a partir de los campos extraídos de Notion"""
+        return cls(
+            id=data["id"],
+            name=data["Name"],
+            tag_code=tag_table.code(data["Tags"]),
+            # Muchos devices enlazan la misma Location: compartir el str del id
+            location_ids=tuple(sys.intern(location_id) for location_id in data["Location"]),
+        )
+    
+    def to_dict(self):
+        """Campos en el mismo formato que from_dict (para la copia en disco)"""
+        return {
+            "id": self.id,
+            "Name": self.name,
+            "Tags": self.tag,
+            "Location": list(self.location_ids),
+        }
+
+
+class SchemaMismatch(Exception):
+    """Propiedad de Notion que no tiene la forma que espera el esquema"""
+
+
+def read_title(prop):
+    title = prop["title"]
+    return title[0]["text"]["content"] if title else None
+
+
+def read_select(prop):
+    select = prop["select"]
+    return select["name"] if select else None
+
+
+def read_relation_ids(prop):
+    return [item["id"] for item in prop["relation"]]
+
+
+def read_number(prop):
+    return prop["number"]
+
+
+def read_date(prop):
+    value = prop["date"]
+    return value["start"] if value else None
+
+
+# Cómo leer cada clase de campo: (tipo de propiedad en Notion, lector). Notion
+# solo incluye en cada propiedad la clave de su tipo, así que si el tipo cambia
+# el lector falla con KeyError y la página pasa al extractor comprobado.
+PROPERTY_KINDS = {
+    "title": ("title", read_title),
+    "select": ("select", read_select),
+    "relation_ids": ("relation", read_relation_ids),
+    "number": ("number", read_number),
+    "date": ("date", read_date),
+}
+
+
+def field_reader(prop_name, reader, default):
+    """Lector de un campo: valor de la propiedad, o el valor por defecto si está vacía"""
+    def read(props):
+        value = reader(props[prop_name])
+        return default if value is None else value
+    return read
+
+
+class PageSchema:
+    """Esquema de las propiedades que se leen de una base de datos de Notion"""
+    
+    def __init__(self, name, fields, build=dict):
+        self.name = name
+        self.fields = fields
+        self.build = build
+        self.readers = [
+            (key, field_reader(prop_name, PROPERTY_KINDS[kind][1], default))
+            for key, prop_name, kind, default in fields
+        ]
+        # Páginas con cada problema de esquema, por (propiedad, motivo)
+        self.warnings = {}
+    
+    def extract(self, page):
+        """Registro de una página; si no encaja con el esquema, campo a campo con extract_checked"""
+        try:
+            props = page["properties"]
+            data = {"id": page["id"]}
+            for key, read in self.readers:
+                data[key] = read(props)
+        except (KeyError, IndexError, TypeError, SchemaMismatch):
+            return self.extract_checked(page)
+        return self.build(data)
+    
+    def extract_checked(self, page):
+        """Extractor campo a campo que registra cada propiedad que no encaja con el esquema"""
+        props = page["properties"]
+        data = {"id": page["id"]}
+        
+        for key, prop_name, kind, default in self.fields:
+            prop_type, reader = PROPERTY_KINDS[kind]
+            prop = props.get(prop_name)
+            value = None
+            problem = None
+            
+            if prop is None:
+                problem = "no existe"
+            elif prop.get("type", prop_type) != prop_type:
+                problem = f"es de tipo {prop['type']}"
+            else:
+                try:
+                    value = reader(prop)
+                except (KeyError, IndexError, TypeError, SchemaMismatch) as exc:
+                    problem = f"tiene un formato inesperado ({exc!r})"
+            
+            if problem:
+                self.warnings.setdefault((prop_name, problem), set()).add(page["id"])
+            data[key] = default if value is None else value
+        
+        return self.build(data)
+    
+    def reset_warnings(self):
+        """Olvida los problemas vistos (al recargar la base de datos entera se vuelven a contar)"""
+        self.warnings = {}
+    
+    def property_names(self):
+        """Propiedades de Notion que lee el esquema (las únicas que hay que descargar)"""
+        return list(dict.fromkeys(prop_name for _, prop_name, _, _ in self.fields))
+    
+    def extract_many(self, pages):
+        """Aplica el extractor a un lote de páginas"""
+        extract = self.extract
+        return [extract(page) for page in pages]
+    
+    def warning_messages(self):
+        """Descripción de cada problema de esquema visto, con cuántas páginas lo tenían"""
+        return [
+            f"{self.name}: la propiedad '{prop_name}' {reason} en {len(page_ids)} páginas"
+            for (prop_name, reason), page_ids in sorted(self.warnings.items())
+        ]
+
+
+# Campos que se leen de Devices (las fechas de las reservas se leen de las Locations enlazadas)
+DEVICE_SCHEMA = PageSchema("Devices", [
+    ("Name", "Name", "title", "Sin nombre"),
+    ("Tags", "Tags", "select", "Sin tag"),
+    ("Location", "Location", "relation_ids", ()),
+], build=Device.from_dict)
+
+
+def tags_of(devices):
+    """Etiquetas con devices, por orden alfabético y "Sin tag" al final"""
+    return sorted({device.tag for device in devices}, key=lambda tag: (tag == "Sin tag", tag))
+
+
+class AvailabilityCalendar:
+    """Devices libres por día en los próximos días, calculado con un barrido (sweep-line) sobre las reservas"""
+    
+    def __init__(self, devices, bookings, first_day, days):
+        self.devices = devices
+        self.first_day = first_day
+        self.days = days
+        last_day = first_day + timedelta(days=days - 1)
+        
+        owners, first_offsets, last_offsets = [], [], []
+        for position, device_bookings in enumerate(bookings):
+            for booking_start, booking_end in device_bookings:
+                if booking_start > last_day or booking_end < first_day:
+                    continue
+                owners.append(position)
+                first_offsets.append((max(booking_start, first_day) - first_day).days)
+                last_offsets.append((min(booking_end, last_day) - first_day).days)
+        
+        # Eventos +1/-1 por device y día, y suma acumulada a lo largo de los días
+        owners = np.array(owners, dtype=np.intp)
+        events = np.zeros((len(devices), days + 1), dtype=np.int32)
+        np.add.at(events, (owners, np.array(first_offsets, dtype=np.intp)), 1)
+        np.add.at(events, (owners, np.array(last_offsets, dtype=np.intp) + 1), -1)
+        self.free = np.cumsum(events[:, :days], axis=1) == 0
+        
+        self.tag_codes = np.array([device.tag_code for device in devices], dtype=np.int32)
+    
+    def dates(self):
+        return pd.date_range(self.first_day, periods=self.days)
+    
+    def tags(self):
+        return tags_of(self.devices)
+    
+    def free_by_tag(self):
+        """Devices libres por etiqueta (filas) y día (columnas)"""
+        counts = pd.DataFrame(self.free, index=self.tag_codes, columns=self.dates()).groupby(level=0).sum()
+        counts.index = [tag_table.name(code) for code in counts.index]
+        return counts.loc[self.tags()]
+    
+    def free_by_device(self, tag):
+        """Días libres (1) u ocupados (0) de cada device de una etiqueta, por nombre"""
+        tag_code = tag_table.code(tag)
+        positions = np.flatnonzero(self.tag_codes == tag_code)
+        device_index = build_device_index([self.devices[position] for position in positions])
+        labels = [device_label(device_index, self.devices[position].id) for position in positions]
+        return pd.DataFrame(self.free[positions].astype(np.int8), index=labels, columns=self.dates()).sort_index()
+
+
+def free_gaps(device_bookings, first_day):
+    """Huecos libres (inicio, fin) de un device desde first_day; el último acaba en date.max"""
+    gaps = []
+    cursor = first_day
+    
+    # Las reservas van ordenadas por inicio: el cursor salta al final de cada una
+    for booking_start, booking_end in device_bookings:
+        if booking_start > cursor:
+            gaps.append((cursor, booking_start - timedelta(days=1)))
+        if booking_end >= cursor:
+            if booking_end == date.max:
+                return gaps
+            cursor = booking_end + timedelta(days=1)
+    
+    gaps.append((cursor, date.max))
+    return gaps
+
+
+def earliest_windows(devices, bookings, tag, quantity, duration, first_day, horizon_days, limit=3):
+    """Primeras fechas en que hay `quantity` devices de una etiqueta libres durante `duration` días"""
+    last_day = first_day + timedelta(days=horizon_days - 1)
+    length = timedelta(days=duration - 1)
+    
+    # Rangos de inicio válidos de cada device: (primer inicio, último inicio, fin del hueco, posición)
+    start_ranges = []
+    for position, device in enumerate(devices):
+        if device.tag != tag:
+            continue
+        for gap_start, gap_end in free_gaps(bookings[position], first_day):
+            if gap_start > last_day:
+                break
+            latest_start = min(gap_end - length, last_day) if gap_end != date.max else last_day
+            if latest_start >= gap_start:
+                start_ranges.append((gap_start, latest_start, gap_end, position))
+    
+    # +1/-1 en los extremos de cada rango: la suma acumulada cuenta los devices que pueden empezar cada día
+    events = np.zeros(horizon_days + 1, dtype=np.int32)
+    for earliest_start, latest_start, _, _ in start_ranges:
+        events[(earliest_start - first_day).days] += 1
+        events[(latest_start - first_day).days + 1] -= 1
+    feasible = np.cumsum(events[:horizon_days]) >= quantity
+    
+    # Tramos de días en los que se puede empezar
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], feasible, [False])).astype(np.int8)))
+    windows = []
+    for run_start, run_end in zip(edges[0::2][:limit], edges[1::2][:limit]):
+        start_date = first_day + timedelta(days=int(run_start))
+        # Primero los de hueco más ajustado, para no gastar los huecos largos
+        candidates = sorted(
+            (gap_end, devices[position].name, position)
+            for earliest_start, latest_start, gap_end, position in start_ranges
+            if earliest_start <= start_date <= latest_start
+        )
+        windows.append({
+            "start": start_date,
+            "end": start_date + length,
+            "latest_start": first_day + timedelta(days=int(run_end) - 1),
+            "device_ids": [devices[position].id for _, _, position in candidates[:quantity]],
+        })
+    
+    return windows
+
+
+# Campos de una location (In House o Client, según Type) y fechas de su reserva.
+# Se descargan todas las locations, de cualquier tipo: un device puede tener
+# reservas en cualquiera de ellas.
+LOCATION_SCHEMA = PageSchema("Locations", [
+    ("name", "Name", "title", "Sin nombre"),
+    ("type", "Type", "select", "Sin tipo"),
+    ("device_count", "Units", "number", 0),
+    ("start", "Start Date", "date", None),
+    ("end", "End Date", "date", None),
+])
+
+
+def loaded_inventory():
+    """Inventario tal como quedó cargado en la última consulta (solo va a Notion si aún no hay datos)"""
+    inventory = get_inventory()
+    if not inventory.has_data():
+        inventory.refresh()
+    return inventory
+
+
+def get_in_house_locations():
+    """Obtiene locations de tipo In House (copia local sincronizada con Notion)"""
+    return loaded_inventory().locations_of_type("In House")
+
+
+# ====================================================
+# 🔹 NUEVA FUNCIÓN: Obtener locations tipo Client
+# ====================================================
+def get_client_locations():
+    """Obtiene locations de tipo Client (copia local sincronizada con Notion)"""
+    return loaded_inventory().locations_of_type("Client")
+# ====================================================
+
+
+# ====================================================
+# 🔹 Copia local de Notion con sincronización incremental
+# ====================================================
+class SnapshotStore:
+    """Copia en disco (SQLite) de los snapshots de Notion, para arrancar rápido y seguir sirviendo si Notion falla"""
+    
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        with closing(self.connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "snapshot TEXT, id TEXT, data TEXT, PRIMARY KEY (snapshot, id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "snapshot TEXT PRIMARY KEY, high_water TEXT, full_synced_at REAL, synced_at REAL)"
+            )
+    
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+    
+    def load(self, name):
+        """Registros y estado de sincronización guardados de un snapshot (o None)"""
+        with closing(self.connect()) as conn:
+            state = conn.execute(
+                "SELECT high_water, full_synced_at, synced_at FROM sync_state WHERE snapshot = ?", (name,)
+            ).fetchone()
+            rows = conn.execute("SELECT id, data FROM records WHERE snapshot = ?", (name,)).fetchall()
+        
+        if state is None:
+            return None
+        
+        records = {record_id: json.loads(data) for record_id, data in rows}
+        return records, *state
+    
+    def save(self, snapshot, changed_ids, full):
+        """Guarda los cambios de una sincronización (o todo, si fue completa)"""
+        records = snapshot.records_by_id()
+        
+        with closing(self.connect()) as conn, conn:
+            if full:
+                conn.execute("DELETE FROM records WHERE snapshot = ?", (snapshot.name,))
+                changed_ids = records.keys()
+            
+            conn.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                [
+                    (snapshot.name, record_id, json.dumps(snapshot.dump_record(records[record_id])))
+                    for record_id in changed_ids if record_id in records
+                ]
+            )
+            conn.executemany(
+                "DELETE FROM records WHERE snapshot = ? AND id = ?",
+                [(snapshot.name, record_id) for record_id in changed_ids if record_id not in records]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (snapshot.name, snapshot.high_water, snapshot.full_synced_at, snapshot.synced_at)
+            )
+
+
+class NotionSnapshot:
+    """Copia local de una base de datos de Notion que se actualiza por incrementos (páginas editadas desde la última marca)"""
+    
+    def __init__(self, name, database_id, schema, base_filter=None, store=None, record_type=None):
+        self.name = name
+        self.database_id = database_id
+        self.schema = schema
+        self.base_filter = base_filter
+        self.store = store
+        self.record_type = record_type
+        self.property_ids = None
+        self.high_water = None
+        self.full_synced_at = None
+        self.synced_at = None
+        self.lock = threading.Lock()
+        self.version = 0
+        self._records = {}
+        
+        # Partir de la copia en disco, si la hay
+        saved = store.load(name) if store else None
+        if saved:
+            try:
+                records = {record_id: self.load_record(data) for record_id, data in saved[0].items()}
+            except (KeyError, TypeError):
+                # Copia con un formato antiguo: se ignora y se descarga de nuevo
+                records = None
+            
+            if records is not None:
+                self._records = records
+                self.high_water, self.full_synced_at, self.synced_at = saved[1:]
+                self.version = 1
+    
+    def records(self):
+        """Lista de registros procesados (de solo lectura)"""
+        return list(self._records.values())
+    
+    def records_by_id(self):
+        return self._records
+    
+    def dump_record(self, record):
+        """Registro en formato JSON para la copia en disco"""
+        return record.to_dict() if self.record_type else record
+    
+    def load_record(self, data):
+        if self.record_type:
+            return self.record_type.from_dict(data)
+        
+        # Un registro sin algún campo del esquema es de una versión anterior
+        missing = [key for key, _, _, _ in self.schema.fields if key not in data]
+        if missing:
+            raise KeyError(missing[0])
+        return data
+    
+    def insert(self, page):
+        """Añade (o sustituye) una página recién creada sin esperar a la próxima sincronización"""
+        with self.lock:
+            records = dict(self._records)
+            records[page["id"]] = self.schema.extract(page)
+            self._records = records
+            self.version += 1
+            
+            if self.store:
+                try:
+                    self.store.save(self, {page["id"]}, full=False)
+                except sqlite3.Error:
+                    pass
+    
+    def needs_full_sync(self):
+        """True si toca recargarlo todo (cada FULL_SYNC_INTERVAL, para detectar páginas borradas)"""
+        return self.high_water is None or time.time() - self.full_synced_at >= FULL_SYNC_INTERVAL
+    
+    def sync(self):
+        """Trae de Notion las páginas nuevas o editadas"""
+        with self.lock:
+            full = self.needs_full_sync()
+            
+            if full:
+                query_filter = self.base_filter
+                records = {}
+                self.schema.reset_warnings()
+            else:
+                # Notion redondea last_edited_time al minuto: se repite el último
+                # minuto y los duplicados se resuelven al fusionar por id
+                changed_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": self.high_water}}
+                if self.base_filter:
+                    query_filter = {"and": [self.base_filter, changed_filter]}
+                else:
+                    query_filter = changed_filter
+                records = dict(self._records)
+            
+            payload = {"filter": query_filter} if query_filter else {}
+            
+            # Pedir solo las propiedades del esquema (los IDs de propiedad no cambian
+            # aunque se renombren, así que basta con resolverlos una vez)
+            if self.property_ids is None:
+                available = get_property_ids(self.database_id)
+                self.property_ids = [
+                    available[prop_name] for prop_name in self.schema.property_names() if prop_name in available
+                ]
+            high_water = self.high_water
+            changed_ids = set()
+            modified = False
+            
+            for batch in iter_page_batches(self.database_id, payload, self.property_ids):
+                live_pages = []
+                for page in batch:
+                    changed_ids.add(page["id"])
+                    
+                    if page.get("archived") or page.get("in_trash"):
+                        modified = records.pop(page["id"], None) is not None or modified
+                    else:
+                        live_pages.append(page)
+                    
+                    if high_water is None or page["last_edited_time"] > high_water:
+                        high_water = page["last_edited_time"]
+                
+                complete_relations(live_pages)
+                for page, record in zip(live_pages, self.schema.extract_many(live_pages)):
+                    modified = modified or records.get(page["id"]) != record
+                    records[page["id"]] = record
+            
+            # El filtro por last_edited_time siempre repite el último minuto: la
+            # versión solo cambia si algún registro es distinto del guardado
+            if full:
+                modified = records != self._records
+            
+            # Sustituir de golpe para que los lectores nunca vean una copia a medias
+            self._records = records
+            self.high_water = high_water
+            self.synced_at = time.time()
+            if modified:
+                self.version += 1
+            if full:
+                self.full_synced_at = self.synced_at
+            
+            if self.store:
+                try:
+                    self.store.save(self, changed_ids, full)
+                except sqlite3.Error:
+                    # La copia en disco es solo una ayuda: si falla, se sigue en memoria
+                    pass
+
+
+class Inventory:
+    """Devices y Locations de Notion, sincronizados juntos y compartidos por todas las sesiones"""
+    
+    def __init__(self, store=None):
+        self.devices = NotionSnapshot("devices", DEVICES_ID, DEVICE_SCHEMA, store=store, record_type=Device)
+        self.locations = NotionSnapshot("locations", LOCATIONS_ID, LOCATION_SCHEMA, store=store)
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.synced_at = None
+        self.generation = 0
+        self.last_error = None
+        self.retry_at = 0
+        self._bookings = None
+        self._index = None
+        self._calendar = None
+        self._locations_by_type = None
+        self._results = OrderedDict()
+        self.results_lock = threading.Lock()
+    
+    def snapshots(self):
+        return (self.devices, self.locations)
+    
+    def has_data(self):
+        return all(snapshot.synced_at is not None for snapshot in self.snapshots())
+    
+    def as_of(self):
+        """Momento de la última sincronización completa con Notion (o None)"""
+        if not self.has_data():
+            return None
+        return datetime.fromtimestamp(min(snapshot.synced_at for snapshot in self.snapshots()))
+    
+    def is_fresh(self):
+        return self.synced_at is not None and time.monotonic() - self.synced_at < INVENTORY_TTL
+    
+    def invalidate(self):
+        """Marca la copia como caducada (la próxima lectura sincroniza los cambios)"""
+        self.generation += 1
+        self.synced_at = None
+    
+    def refresh(self):
+        """Sincroniza con Notion si la copia local ha caducado (si Notion falla y hay datos, se siguen sirviendo)"""
+        if self.is_fresh():
+            return self
+        
+        if self.has_data():
+            # Tras un error, no se reintenta hasta pasado ERROR_RETRY_INTERVAL
+            if time.monotonic() < self.retry_at:
+                return self
+            
+            # Caducada por el TTL (o recién cargada de disco): se sirve tal cual y se
+            # sincroniza en otro hilo. Tras una escritura, en cambio, se espera.
+            if self.synced_at is not None or self.generation == 0:
+                self.refresh_in_background()
+                return self
+        
+        try:
+            # Una sincronización que ya estaba en marcha puede haber empezado antes
+            # de la última escritura: en ese caso se lanza otra
+            for _ in range(2):
+                self.flights.do("sync", self.sync)
+                if self.is_fresh():
+                    break
+        except requests.RequestException as exc:
+            if not self.has_data():
+                raise
+            self.last_error = str(exc)
+            self.retry_at = time.monotonic() + ERROR_RETRY_INTERVAL
+        
+        return self
+    
+    def refresh_in_background(self):
+        """Lanza una sincronización en otro hilo (si no hay ya una en marcha)"""
+        if self.flights.in_flight("sync"):
+            return
+        
+        def run():
+            try:
+                self.flights.do("sync", self.sync)
+            except requests.RequestException as exc:
+                self.last_error = str(exc)
+                self.retry_at = time.monotonic() + ERROR_RETRY_INTERVAL
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def sync(self):
+        """Sincroniza Devices y Locations a la vez (en paralelo, cada una con su cursor)"""
+        with self.lock:
+            if self.is_fresh():
+                return
+            
+            generation = self.generation
+            
+            with ThreadPoolExecutor(max_workers=len(self.snapshots())) as executor:
+                for future in [executor.submit(snapshot.sync) for snapshot in self.snapshots()]:
+                    future.result()
+            
+            self.last_error = None
+            
+            # Si hubo una escritura mientras sincronizábamos, seguir caducada
+            if generation == self.generation:
+                self.synced_at = time.monotonic()
+    
+    def version(self):
+        """Versión de los datos de disponibilidad (cambia si cambian los devices o las locations)"""
+        return (self.devices.version, self.locations.version)
+    
+    def query_result(self, start_date, end_date, version=None):
+        """Resultado compartido de una consulta, o None si es de una versión que ya no está en memoria"""
+        version = self.version() if version is None else version
+        key = (version, start_date, end_date)
+        
+        with self.results_lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                return result
+        
+        if version != self.version():
+            return None
+        
+        result = QueryResult(version, self.availability_index().available(start_date, end_date))
+        with self.results_lock:
+            self._results[key] = result
+            while len(self._results) > QUERY_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return result
+    
+    def bookings(self):
+        """Devices y sus reservas (join_bookings), recalculados solo si cambian devices o locations"""
+        bookings = self._bookings
+        version = self.version()
+        if bookings is None or bookings[0] != version:
+            devices = self.devices.records()
+            bookings = (version, devices, join_bookings(devices, self.locations.records_by_id()))
+            self._bookings = bookings
+        return bookings[1], bookings[2]
+    
+    def earliest_windows(self, tag, quantity, duration, first_day):
+        """Primeras ventanas con `quantity` devices de `tag` libres `duration` días (ver earliest_windows)"""
+        devices, bookings = self.bookings()
+        return earliest_windows(devices, bookings, tag, quantity, duration, first_day, WINDOW_SEARCH_DAYS)
+    
+    def availability_calendar(self, first_day, days):
+        """Calendario de disponibilidad desde first_day, reconstruido solo si cambian los datos o la ventana"""
+        calendar = self._calendar
+        key = (self.version(), first_day, days)
+        if calendar is None or calendar[0] != key:
+            devices, bookings = self.bookings()
+            calendar = (key, AvailabilityCalendar(devices, bookings, first_day, days))
+            self._calendar = calendar
+        return calendar[1]
+    
+    def locations_of_type(self, location_type):
+        """Locations de un tipo ("In House", "Client"), del índice por Type en memoria"""
+        index = self._locations_by_type
+        if index is None or index[0] != self.locations.version:
+            by_type = {}
+            for location in self.locations.records():
+                by_type.setdefault(location["type"], []).append(location)
+            index = (self.locations.version, by_type)
+            self._locations_by_type = index
+        return index[1].get(location_type, [])
+    
+    def schema_warnings(self):
+        """Problemas de esquema vistos al leer las páginas de Notion (ver PageSchema)"""
+        return [message for snapshot in self.snapshots() for message in snapshot.schema.warning_messages()]
+    
+    def availability_index(self):
+        """Motor de disponibilidad de los devices, reconstruido solo si han cambiado devices o locations"""
+        index = self._index
+        version = self.version()
+        if index is None or index[0] != version:
+            engine = VectorAvailability if AVAILABILITY_ENGINE == "vector" else AvailabilityIndex
+            devices, bookings = self.bookings()
+            index = (version, engine(devices, bookings))
+            self._index = index
+        return index[1]
+
+
+@st.cache_resource
+def get_inventory():
+    """Inventario compartido por todas las sesiones del proceso (cargado desde disco si existe)"""
+    try:
+        store = SnapshotStore(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+    except (OSError, sqlite3.Error):
+        store = None
+    return Inventory(store)
+# ====================================================
+
+
+def location_payload(name, location_type, start_date, end_date=None):
+    """Página nueva de Locations (In House sin fecha de fin, Client con fecha de fin)"""
+    properties = {
+        "Name": {
+            "title": [
+                {
+                    "text": {
+                        "content": name
+                    }
+                }
+            ]
+        },
+        "Type": {
+            "select": {
+                "name": location_type
+            }
+        },
+        "Start Date": {
+            "date": {
+                "start": start_date.isoformat()
+            }
+        }
+    }
+    if end_date:
+        properties["End Date"] = {
+            "date": {
+                "start": end_date.isoformat()
+            }
+        }
+    
+    return {"parent": {"database_id": LOCATIONS_ID}, "properties": properties}
+
+
+def build_device_index(devices):
+    """Índice de un resultado de consulta: por id de página y, encima, por nombre"""
+    by_id = {}
+    by_name = {}
+    for device in devices:
+        by_id[device.id] = device
+        by_name.setdefault(device.name, []).append(device.id)
+    
+    return {"by_id": by_id, "by_name": by_name}
+
+
+class FacetIndex:
+    """Índice de facetas de un resultado de consulta: etiquetas con recuento y búsqueda por nombre (trigramas)"""
+    
+    NGRAM = 3
+    
+    def __init__(self, devices):
+        # Orden fijo (etiqueta y nombre, sin tag al final): cada etiqueta guarda sus posiciones ya ordenadas
+        self.devices = sorted(devices, key=lambda d: (d.tag == "Sin tag", d.tag, d.name))
+        self.names = [device.name.lower() for device in self.devices]
+        self.by_tag = {}
+        self.grams = {}
+        
+        for position, device in enumerate(self.devices):
+            self.by_tag.setdefault(device.tag, []).append(position)
+            
+            name = self.names[position]
+            for gram in {name[start:start + self.NGRAM] for start in range(len(name) - self.NGRAM + 1)}:
+                self.grams.setdefault(gram, []).append(position)
+    
+    def tag_counts(self):
+        """Número de devices de cada etiqueta (sin "Sin tag"), por orden alfabético"""
+        return {tag: len(positions) for tag, positions in sorted(self.by_tag.items()) if tag != "Sin tag"}
+    
+    def name_matches(self, text):
+        """Posiciones de los devices cuyo nombre contiene text (sin distinguir mayúsculas)"""
+        # Más corto que un trigrama: se recorren los nombres
+        if len(text) < self.NGRAM:
+            return {position for position, name in enumerate(self.names) if text in name}
+        
+        postings = sorted(
+            (self.grams.get(text[start:start + self.NGRAM], []) for start in range(len(text) - self.NGRAM + 1)),
+            key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        
+        if len(text) == self.NGRAM:
+            return candidates
+        return {position for position in candidates if text in self.names[position]}
+    
+    def search(self, tags=(), text=""):
+        """Devices (en orden) de cualquiera de las etiquetas indicadas y cuyo nombre contiene text"""
+        if tags:
+            positions = sorted(position for tag in tags for position in self.by_tag.get(tag, []))
+        else:
+            positions = range(len(self.devices))
+        
+        text = text.strip().lower()
+        if text:
+            matches = self.name_matches(text)
+            positions = [position for position in positions if position in matches]
+        
+        return [self.devices[position] for position in positions]
+
+
+class QueryResult:
+    """Resultado de una consulta de disponibilidad, compartido (de solo lectura) entre sesiones"""
+    
+    def __init__(self, version, devices):
+        self.version = version
+        self.facets = FacetIndex(devices)
+        self.devices = self.facets.devices
+        self.device_index = build_device_index(self.devices)
+        self.positions = {device.id: position for position, device in enumerate(self.devices)}
+    
+    def mask_of(self, devices):
+        """Bitset con los devices indicados"""
+        bits = bytearray(b"0" * len(self.devices))
+        for device in devices:
+            bits[-1 - self.positions[device.id]] = ord("1")
+        return int(bits or b"0", 2)
+    
+    def ids_of(self, mask):
+        """IDs de los devices marcados en el bitset, en el orden del resultado"""
+        return [self.devices[position].id for position, bit in enumerate(reversed(bin(mask)[2:])) if bit == "1"]
+
+
+def device_label(device_index, device_id):
+    """Nombre a mostrar de un device (con parte del id si hay otro con el mismo nombre)"""
+    name = device_index["by_id"][device_id].name
+    if len(device_index["by_name"][name]) > 1:
+        return f"{name} (#{device_id[:8]})"
+    return name
+
+
+def location_booking(location_id):
+    """Intervalo que ocupará un device al enlazarlo a una location existente"""
+    location = get_inventory().locations.records_by_id().get(location_id)
+    if location is None:
+        return (date.min, date.max)
+    return location_interval(location)
+
+
+def read_pages(page_ids, property_ids=None):
+    """Lee varias páginas de Notion a la vez: {id: página, o None si ya no existe}"""
+    def read_page(page_id):
+        try:
+            page = read_notion("GET", with_properties(f"pages/{page_id}", property_ids))
+        except requests.HTTPError as exc:
+            if exc.response is not None and exc.response.status_code == 404:
+                return None
+            raise
+        if page.get("archived") or page.get("in_trash"):
+            return None
+        complete_relations([page])
+        return page
+    
+    page_ids = list(dict.fromkeys(page_ids))
+    if not page_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(ASSIGN_WORKERS, len(page_ids))) as executor:
+        return dict(zip(page_ids, executor.map(read_page, page_ids)))
+
+
+def recheck_devices(devices, booking, location_id=None):
+    """Comprueba contra Notion que los devices siguen libres en `booking`; devuelve (libres, conflictos con su motivo)"""
+    # Solo las páginas de los devices seleccionados y de sus locations, no la base de datos entera
+    inventory = get_inventory()
+    device_pages = read_pages([device.id for device in devices], inventory.devices.property_ids)
+    fresh_devices = {
+        device_id: DEVICE_SCHEMA.extract(page) for device_id, page in device_pages.items() if page is not None
+    }
+    queued = get_job_queue().queued_bookings(list(fresh_devices))
+    
+    # La location de destino no es un conflicto: enlazarla otra vez no cambia nada
+    linked_ids = [
+        linked_id
+        for device_id, device in fresh_devices.items()
+        for linked_id in (*device.location_ids, *(job[0] for job in queued.get(device_id, [])))
+        if linked_id and linked_id != location_id
+    ]
+    location_pages = read_pages(linked_ids, inventory.locations.property_ids)
+    
+    def linked_booking(linked_id):
+        """(nombre, intervalo) de una location enlazada; si ya no existe, ocupa indefinidamente"""
+        page = location_pages[linked_id]
+        if page is None:
+            return None, (date.min, date.max)
+        location = LOCATION_SCHEMA.extract(page)
+        return location["name"], location_interval(location)
+    
+    today = date.today()
+    free_devices = []
+    conflicts = []
+    for device in devices:
+        fresh = fresh_devices.get(device.id)
+        if fresh is None:
+            conflicts.append((device, "ya no existe en Notion"))
+            continue
+        
+        # Reservas actuales: locations enlazadas en Notion y trabajos aún en cola
+        reservations = [linked_booking(linked_id) for linked_id in fresh.location_ids if linked_id != location_id]
+        for queued_id, queued_name, queued_interval in queued.get(device.id, []):
+            if queued_id is None:
+                reservations.append((queued_name, queued_interval))
+            elif queued_id != location_id:
+                reservations.append(linked_booking(queued_id))
+        
+        clashes = clashing_reservations(reservations, *booking)
+        if not clashes:
+            # La relación que se escribirá: sin las reservas que ya terminaron
+            current_ids = tuple(
+                linked_id for linked_id in fresh.location_ids
+                if linked_id == location_id or linked_booking(linked_id)[1][1] >= today
+            )
+            free_devices.append(replace(fresh, location_ids=current_ids))
+        elif clashes[0] is None:
+            conflicts.append((device, "enlazado a una ubicación que ya no existe"))
+        else:
+            conflicts.append((device, f"reservado en '{clashes[0]}'"))
+    
+    return free_devices, conflicts
+
+
+def submit_assignment(device_ids, device_index, location_name, booking, location_id=None, new_location=None):
+    """Comprueba la selección contra Notion y encola su reserva en `booking`; devuelve el id del trabajo (o None)"""
+    
+    # Descartar los ids que no están en el resultado de la consulta
+    known_devices = []
+    for device_id in device_ids:
+        if device_id in device_index["by_id"]:
+            known_devices.append(device_index["by_id"][device_id])
+        else:
+            st.warning(f"⚠️ No se encontró el dispositivo '{device_id}'")
+    
+    if not known_devices:
+        st.error("❌ No hay dispositivos que asignar")
+        return None
+    
+    # Otro usuario puede haber reservado los mismos devices desde la consulta
+    with st.spinner("Comprobando que los dispositivos siguen libres..."):
+        try:
+            free_devices, conflicts = recheck_devices(known_devices, booking, location_id)
+        except requests.RequestException as exc:
+            st.error(f"❌ No se pudo comprobar la disponibilidad en Notion: {exc}")
+            return None
+    
+    if conflicts:
+        # Los datos de la consulta estaban desfasados: la próxima consulta sincroniza
+        get_inventory().invalidate()
+    
+    if not free_devices:
+        for device, reason in conflicts:
+            st.warning(f"⚠️ '{device_label(device_index, device.id)}' ya no está libre ({reason})")
+        st.error("❌ Ninguno de los dispositivos sigue libre: vuelve a consultar la disponibilidad")
+        return None
+    
+    # Los conflictos quedan en el trabajo y se ven en su estado
+    return get_job_queue().submit(
+        free_devices, location_name, location_id, new_location,
+        [(device, f"ya no está libre ({reason}), no se asigna") for device, reason in conflicts]
+    )
+
+
+def assign_devices_client(device_ids, client_name, start_date, end_date, device_index):
+    """Asigna dispositivos a un cliente (crea nueva location Client)"""
+    
+    if not client_name or client_name.strip() == "":
+        st.error("⚠️ El nombre del destino no puede estar vacío")
+        return None
+    
+    # La location se crea en el mismo trabajo, antes de enlazar los devices
+    return submit_assignment(
+        device_ids, device_index, client_name, (start_date, end_date),
+        new_location=location_payload(client_name, "Client", start_date, end_date)
+    )
+
+
+# ====================================================
+# 🔹 NUEVA FUNCIÓN: Asignar a location Client existente
+# ====================================================
+def assign_devices_to_existing_client(device_ids, location_id, location_name, device_index):
+    """Asigna dispositivos a una location Client existente"""
+    booking = location_booking(location_id)
+    return submit_assignment(device_ids, device_index, location_name, booking, location_id=location_id)
+# ====================================================
+
+
+def assign_devices_in_house(device_ids, location_id, location_name, start_date, device_index):
+    """Asigna dispositivos a una ubicación In House existente"""
+    # Se reserva desde la fecha de inicio elegida, no desde el inicio de la location
+    return submit_assignment(device_ids, device_index, location_name, (start_date, date.max), location_id=location_id)
+
+
+def assign_devices_new_in_house(device_ids, location_name, start_date, device_index):
+    """Asigna dispositivos a una ubicación In House nueva (se crea en el mismo trabajo)"""
+    
+    if not location_name or location_name.strip() == "":
+        st.error("⚠️ El nombre no puede estar vacío")
+        return None
+    
+    return submit_assignment(
+        device_ids, device_index, location_name, (start_date, date.max),
+        new_location=location_payload(location_name, "In House", start_date)
+    )
+
+
+# ====================================================
+# 🔹 Cola de asignaciones en disco (write-behind)
+# ====================================================
+def assign_device(device_id, location_ids):
+    """Deja la relación Location de un device con las locations indicadas (PATCH idempotente: se puede reintentar)"""
+    payload_device = {
+        "properties": {
+            "Location": {
+                "relation": [
+                    {"id": location_id} for location_id in location_ids
+                ]
+            }
+        }
+    }
+    
+    return notion.request("PATCH", f"pages/{device_id}", json=payload_device)
+
+
+def is_retryable(response):
+    """True si un error de Notion puede ir mejor más tarde (límite de ritmo o fallo del servidor)"""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class AssignmentQueue:
+    """Cola durable (SQLite) de asignaciones, ejecutada por un worker en segundo plano"""
+    
+    def __init__(self, path, inventory):
+        self.path = path
+        self.inventory = inventory
+        self.wakeup = threading.Event()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        with closing(self.connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, created_at REAL, location_name TEXT, location_id TEXT, "
+                "new_location TEXT, attempts INTEGER, retry_at REAL, status TEXT, error TEXT, finished_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                "job_id TEXT, device_id TEXT, device_name TEXT, relation TEXT, "
+                "attempts INTEGER, retry_at REAL, status TEXT, error TEXT, finished_at REAL, "
+                "PRIMARY KEY (job_id, device_id))"
+            )
+            
+            # Los trabajos terminados se guardan un tiempo para poder ver su estado
+            old_jobs = "SELECT id FROM jobs WHERE status != 'pending' AND finished_at < ?"
+            cutoff = time.time() - JOB_RETENTION
+            conn.execute(f"DELETE FROM job_items WHERE job_id IN ({old_jobs})", (cutoff,))
+            conn.execute("DELETE FROM jobs WHERE status != 'pending' AND finished_at < ?", (cutoff,))
+        
+        threading.Thread(target=self.run, daemon=True).start()
+    
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+    
+    def submit(self, devices, location_name, location_id=None, new_location=None, conflicts=()):
+        """Guarda un trabajo y devuelve su id (los conflictos se guardan ya cerrados, con su motivo)"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, 0, 0, 'pending', NULL, NULL)",
+                (job_id, now, location_name, location_id, json.dumps(new_location) if new_location else None)
+            )
+            conn.executemany(
+                "INSERT INTO job_items VALUES (?, ?, ?, ?, 0, 0, 'pending', NULL, NULL)",
+                [
+                    (job_id, device.id, device.name, json.dumps(list(device.location_ids)))
+                    for device in devices
+                ]
+            )
+            conn.executemany(
+                "INSERT INTO job_items VALUES (?, ?, ?, '[]', 0, 0, 'conflict', ?, ?)",
+                [(job_id, device.id, device.name, reason, now) for device, reason in conflicts]
+            )
+        
+        self.wakeup.set()
+        return job_id
+    
+    def queued_bookings(self, device_ids):
+        """Reservas de estos devices aún en la cola: {device_id: [(location_id o None, nombre, intervalo o None)]}"""
+        if not device_ids:
+            return {}
+        
+        marks = ", ".join("?" * len(device_ids))
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT i.device_id, j.location_id, j.location_name, j.new_location FROM job_items i "
+                "JOIN jobs j ON j.id = i.job_id WHERE i.status = 'pending' AND j.status = 'pending' "
+                f"AND i.device_id IN ({marks})",
+                device_ids
+            ).fetchall()
+        
+        bookings = {}
+        for device_id, location_id, location_name, new_location in rows:
+            # El intervalo solo se sabe aquí si la location aún no existe (sale de su payload)
+            interval = None
+            if location_id is None:
+                properties = json.loads(new_location)["properties"]
+                interval = location_interval({
+                    "start": properties["Start Date"]["date"]["start"],
+                    "end": properties["End Date"]["date"]["start"] if "End Date" in properties else None,
+                })
+            bookings.setdefault(device_id, []).append((location_id, location_name, interval))
+        return bookings
+    
+    def statuses(self, job_ids):
+        """Estado y progreso de varios trabajos, en el mismo orden"""
+        if not job_ids:
+            return []
+        
+        marks = ", ".join("?" * len(job_ids))
+        with closing(self.connect()) as conn:
+            jobs = {
+                row[0]: row[1:] for row in conn.execute(
+                    f"SELECT id, location_name, status, error FROM jobs WHERE id IN ({marks})", job_ids
+                )
+            }
+            counts = Counter()
+            errors = {}
+            for job_id, device_name, status, error in conn.execute(
+                f"SELECT job_id, device_name, status, error FROM job_items WHERE job_id IN ({marks})", job_ids
+            ):
+                counts[(job_id, status)] += 1
+                if status in ("failed", "conflict"):
+                    errors.setdefault(job_id, []).append(f"{device_name}: {error}")
+        
+        statuses = []
+        for job_id in job_ids:
+            if job_id not in jobs:
+                continue
+            location_name, status, error = jobs[job_id]
+            done, pending = counts[(job_id, "done")], counts[(job_id, "pending")]
+            failed = counts[(job_id, "failed")] + counts[(job_id, "conflict")]
+            statuses.append({
+                "id": job_id,
+                "location_name": location_name,
+                "status": status,
+                "error": error,
+                "total": done + failed + pending,
+                "done": done,
+                "failed": failed,
+                "errors": errors.get(job_id, []),
+            })
+        return statuses
+    
+    def run(self):
+        """Bucle del worker: ejecuta lo pendiente y, si no hay nada listo, espera a un trabajo nuevo"""
+        while True:
+            try:
+                worked = self.run_once()
+            except Exception:
+                # El worker no puede morir: lo que tenía reclamado vuelve a la cola al caducar JOB_LEASE
+                logger.exception("Error en el worker de asignaciones")
+                worked = False
+            
+            if not worked:
+                self.wakeup.wait(JOB_POLL_INTERVAL)
+                self.wakeup.clear()
+    
+    def run_once(self):
+        """Crea las locations pendientes y lanza un lote de PATCH; devuelve True si hizo algo"""
+        now = time.time()
+        self.expire_attempts(now)
+        
+        # Reclamar el trabajo con un UPDATE (atómico): si hay otro worker sobre el
+        # mismo diario no lo coge a la vez, y si este muere, queda libre al
+        # caducar JOB_LEASE. Cada reclamación cuenta como intento.
+        with closing(self.connect()) as conn, conn:
+            new_locations = conn.execute(
+                "UPDATE jobs SET retry_at = ?, attempts = attempts + 1 "
+                "WHERE status = 'pending' AND location_id IS NULL AND retry_at <= ? AND attempts < ? "
+                "RETURNING id, created_at, location_name, new_location, attempts",
+                (now + JOB_LEASE, now, JOB_MAX_ATTEMPTS)
+            ).fetchall()
+        
+        for job in new_locations:
+            try:
+                self.create_location(*job)
+            except Exception as exc:
+                logger.exception("Error al crear la ubicación del trabajo %s", job[0])
+                self.retry_job(job[0], job[4], repr(exc))
+        
+        with closing(self.connect()) as conn, conn:
+            rows = conn.execute(
+                "UPDATE job_items SET retry_at = ?, attempts = attempts + 1 WHERE rowid IN ("
+                "SELECT i.rowid FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                "WHERE i.status = 'pending' AND j.status = 'pending' AND j.location_id IS NOT NULL "
+                "AND i.retry_at <= ? AND i.attempts < ? ORDER BY j.created_at LIMIT ?) "
+                "RETURNING job_id, device_id, relation, attempts",
+                (now + JOB_LEASE, now, JOB_MAX_ATTEMPTS, JOB_BATCH_SIZE)
+            ).fetchall()
+        
+        batch = {}
+        for job_id, device_id, relation, attempts in rows:
+            try:
+                with closing(self.connect()) as conn, conn:
+                    # Un device solo una vez por lote: dos PATCH a la vez se pisarían la relación
+                    if device_id in batch:
+                        conn.execute(
+                            "UPDATE job_items SET retry_at = 0, attempts = attempts - 1 "
+                            "WHERE job_id = ? AND device_id = ?",
+                            (job_id, device_id)
+                        )
+                        continue
+                    
+                    location_id, created_at = conn.execute(
+                        "SELECT location_id, created_at FROM jobs WHERE id = ?", (job_id,)
+                    ).fetchone()
+                    # Locations que otros trabajos le han añadido desde que se encoló este
+                    added = [
+                        row[0] for row in conn.execute(
+                            "SELECT j.location_id FROM job_items i JOIN jobs j ON j.id = i.job_id "
+                            "WHERE i.device_id = ? AND i.status = 'done' AND i.finished_at >= ?",
+                            (device_id, created_at)
+                        )
+                    ]
+                location_ids = list(dict.fromkeys((*json.loads(relation), *added, location_id)))
+            except Exception as exc:
+                logger.exception("Error al preparar la asignación del device %s", device_id)
+                self.record_result(job_id, device_id, attempts, "pending", repr(exc))
+                self.close_jobs({job_id})
+                continue
+            batch[device_id] = (job_id, attempts, location_ids)
+        
+        if batch:
+            self.run_batch(batch)
+        
+        return bool(new_locations or rows)
+    
+    def expire_attempts(self, now):
+        """Da por fallido lo que agotó sus intentos sin llegar a terminar (el worker murió a mitad)"""
+        with closing(self.connect()) as conn, conn:
+            jobs = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'pending' AND location_id IS NULL "
+                "AND attempts >= ? AND retry_at <= ?",
+                (JOB_MAX_ATTEMPTS, now)
+            ).fetchall()
+            items = conn.execute(
+                "UPDATE job_items SET status = 'failed', error = 'se agotaron los intentos', finished_at = ? "
+                "WHERE status = 'pending' AND attempts >= ? AND retry_at <= ? RETURNING job_id",
+                (now, JOB_MAX_ATTEMPTS, now)
+            ).fetchall()
+        
+        for (job_id,) in jobs:
+            self.fail_job(job_id, "Error al crear la ubicación: se agotaron los intentos")
+        if items:
+            self.close_jobs({job_id for job_id, in items})
+    
+    def create_location(self, job_id, created_at, location_name, new_location, attempts):
+        """Crea la location de un trabajo (o recupera la que creó un intento anterior)"""
+        # Si ya hubo un intento, su POST pudo llegar a Notion sin que llegara la respuesta (por eso no se
+        # reintenta aquí: el siguiente intento del trabajo busca antes la location)
+        try:
+            location_id = self.find_created_location(location_name, created_at) if attempts > 1 else None
+            response = None if location_id else notion.create_page(json.loads(new_location))
+        except requests.RequestException as exc:
+            return self.retry_job(job_id, attempts, str(exc))
+        
+        if response is not None:
+            if response.status_code != 200:
+                if is_retryable(response):
+                    return self.retry_job(job_id, attempts, response.text)
+                return self.fail_job(job_id, f"Error al crear la ubicación: {response.text}")
+            
+            data = response.json()
+            location_id = data["id"]
+            self.inventory.locations.insert(data)
+        
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET location_id = ?, retry_at = 0, error = NULL WHERE id = ?", (location_id, job_id)
+            )
+    
+    def find_created_location(self, location_name, created_at):
+        """Location con ese nombre creada desde que se encoló el trabajo (o None)"""
+        # created_time de Notion va redondeado al minuto
+        since = datetime.fromtimestamp(created_at - 60, tz=timezone.utc).isoformat()
+        data = fetch_json("POST", f"databases/{LOCATIONS_ID}/query", {
+            "filter": {
+                "and": [
+                    {"property": "Name", "title": {"equals": location_name}},
+                    {"timestamp": "created_time", "created_time": {"on_or_after": since}},
+                ]
+            }
+        })
+        return data["results"][0]["id"] if data["results"] else None
+    
+    def retry_job(self, job_id, attempts, error):
+        if attempts >= JOB_MAX_ATTEMPTS:
+            return self.fail_job(job_id, f"Error al crear la ubicación: {error}")
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET retry_at = ?, error = ? WHERE id = ?",
+                (time.time() + 2 ** attempts, error, job_id)
+            )
+    
+    def fail_job(self, job_id, error):
+        now = time.time()
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?", (error, now, job_id)
+            )
+            conn.execute(
+                "UPDATE job_items SET status = 'failed', error = 'no se creó la ubicación', finished_at = ? "
+                "WHERE job_id = ? AND status = 'pending'",
+                (now, job_id)
+            )
+    
+    def run_batch(self, batch):
+        """Lanza en paralelo los PATCH de un lote y apunta cada resultado según llega"""
+        assigned = False
+        
+        with ThreadPoolExecutor(max_workers=ASSIGN_WORKERS) as executor:
+            futures = {
+                executor.submit(assign_device, device_id, location_ids): device_id
+                for device_id, (_, _, location_ids) in batch.items()
+            }
+            
+            for future in as_completed(futures):
+                device_id = futures[future]
+                job_id, attempts, _ = batch[device_id]
+                status, error = "done", None
+                
+                try:
+                    response = future.result()
+                    if response.status_code != 200:
+                        error = response.text
+                        status = "pending" if is_retryable(response) else "failed"
+                except requests.RequestException as exc:
+                    error = str(exc)
+                    status = "pending"
+                except Exception as exc:
+                    logger.exception("Error al asignar el device %s", device_id)
+                    error = repr(exc)
+                    status = "pending"
+                
+                status = self.record_result(job_id, device_id, attempts, status, error)
+                assigned = assigned or status == "done"
+        
+        self.close_jobs({job_id for job_id, _, _ in batch.values()})
+        
+        # Las asignaciones cambian la disponibilidad: forzar recarga del inventario
+        if assigned:
+            self.inventory.invalidate()
+    
+    def record_result(self, job_id, device_id, attempts, status, error=None):
+        """Apunta el resultado de un device; lo reintentable espera cada vez más, hasta JOB_MAX_ATTEMPTS"""
+        retry_at = 0
+        if status == "pending":
+            if attempts >= JOB_MAX_ATTEMPTS:
+                status = "failed"
+            else:
+                retry_at = time.time() + 2 ** attempts
+        
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "UPDATE job_items SET status = ?, error = ?, retry_at = ?, finished_at = ? "
+                "WHERE job_id = ? AND device_id = ?",
+                (status, error, retry_at, None if status == "pending" else time.time(), job_id, device_id)
+            )
+        return status
+    
+    def close_jobs(self, job_ids):
+        """Cierra los trabajos que ya no tienen devices pendientes"""
+        now = time.time()
+        with closing(self.connect()) as conn, conn:
+            for job_id in job_ids:
+                counts = dict(conn.execute(
+                    "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+                ).fetchall())
+                if counts.get("pending"):
+                    continue
+                not_assigned = counts.get("failed", 0) + counts.get("conflict", 0)
+                status = "done" if not not_assigned else "partial" if counts.get("done") else "failed"
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'pending'",
+                    (status, now, job_id)
+                )
+
+
+@st.cache_resource
+def get_job_queue():
+    """Cola de asignaciones del proceso (su worker retoma los trabajos pendientes al arrancar)"""
+    return AssignmentQueue(JOBS_PATH, get_inventory())
+# ====================================================
+
+
+def session_result():
+    """Resultado (compartido) de la última consulta de esta sesión, o None si ya no está disponible"""
+    return get_inventory().query_result(
+        st.session_state.query_start_date,
+        st.session_state.query_end_date,
+        st.session_state.result_version
+    )
+
+
+def selected_device_ids(result):
+    """IDs seleccionados en esta sesión, en el orden del resultado"""
+    return result.ids_of(st.session_state.selected_mask)
+
+
+def finish_assignment(job_id):
+    """Tras encolar una asignación: la sigue en esta sesión, vacía la selección y vuelve a pintar la app"""
+    st.session_state.assignment_jobs.append(job_id)
+    st.session_state.selected_mask = 0
+    st.session_state.search_completed = False
+    st.rerun()
+
 
+def clear_finished_jobs():
+    """Callback del botón que oculta los trabajos ya terminados"""
+    statuses = get_job_queue().statuses(st.session_state.assignment_jobs)
+    st.session_state.assignment_jobs = [job["id"] for job in statuses if job["status"] == "pending"]
 
-def get_pages(database_id):
-    """Obtiene todas las páginas de una base de datos de Notion"""
-    url = f"https://api.notion.com/v1/databases/{database_id}/query"
-    payload = {"page_size": 100}
-    
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
-    
-    return data.get("results", [])
 
+def toggle_device(device_id, position):
+    """Callback de cada checkbox: añade o quita el device de la selección"""
+    if st.session_state[f"check_{device_id}"]:
+        st.session_state.selected_mask |= 1 << position
+    else:
+        st.session_state.selected_mask &= ~(1 << position)
 
-def extract_device_data(page):
-    """Extrae los campos específicos de cada dispositivo"""
-    props = page["properties"]
-    device_data = {}
-    
-    # Extraer ID de la página
-    device_data["id"] = page["id"]
-    
-    # Extraer Name (nombre del dispositivo)
-    try:
-        if props.get("Name") and props["Name"]["title"]:
-            device_data["Name"] = props["Name"]["title"][0]["text"]["content"]
-        else:
-            device_data["Name"] = "Sin nombre"
-    except:
-        device_data["Name"] = "Sin nombre"
-    
-    # Extraer Tags (etiqueta del dispositivo, como "Ultra" o "Neo 4")
-    try:
-        if props.get("Tags") and props["Tags"]["select"]:
-            device_data["Tags"] = props["Tags"]["select"]["name"]
-        else:
-            device_data["Tags"] = "Sin tag"
-    except:
-        device_data["Tags"] = "Sin tag"
-    
-    # Extraer Locations_demo (contador de ubicaciones asignadas)
-    try:
-        if props.get("Location") and props["Location"]["relation"]:
-            location_ids = [rel["id"] for rel in props["Location"]["relation"]]
-            device_data["Locations_demo_count"] = len(location_ids)
-        else:
-            device_data["Locations_demo_count"] = 0
-    except:
-        device_data["Locations_demo_count"] = 0
-    
-    # Extraer Start Date (fecha de inicio de la reserva)
-    try:
-        if props.get("Start Date") and props["Start Date"]["rollup"]:
-            rollup = props["Start Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["Start Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["Start Date"] = first_item["date"]["start"]
-                else:
-                    device_data["Start Date"] = None
-            else:
-                device_data["Start Date"] = None
-        else:
-            device_data["Start Date"] = None
-    except:
-        device_data["Start Date"] = None
-    
-    # Extraer End Date (fecha de fin de la reserva)
-    try:
-        if props.get("End Date") and props["End Date"]["rollup"]:
-            rollup = props["End Date"]["rollup"]
-            if rollup["type"] == "date" and rollup.get("date"):
-                device_data["End Date"] = rollup["date"]["start"]
-            elif rollup["type"] == "array" and rollup["array"]:
-                first_item = rollup["array"][0]
-                if first_item["type"] == "date" and first_item.get("date"):
-                    device_data["End Date"] = first_item["date"]["start"]
-                else:
-                    device_data["End Date"] = None
-            else:
-                device_data["End Date"] = None
-        else:
-            device_data["End Date"] = None
-    except:
-        device_data["End Date"] = None
-    
-    return device_data
 
+def select_devices(mask):
+    """Callback de "seleccionar todos": añade a la selección todos los devices filtrados"""
+    st.session_state.selected_mask |= mask
 
-def check_availability(device, start_date, end_date):
-    """Verifica si un dispositivo está disponible en el rango de fechas solicitado"""
-    
-    # Si no tiene ubicación = está disponible
-    if device["Locations_demo_count"] == 0:
-        return True
-    
-    # Si tiene ubicación, verificar las fechas
-    device_start = device["Start Date"]
-    device_end = device["End Date"]
+
+def clear_selection():
+    """Callback del botón de quitar selección"""
+    st.session_state.selected_mask = 0
+
+
+def change_picker_page(step):
+    """Callback de los botones Anterior / Siguiente"""
+    st.session_state.picker_page = max(0, st.session_state.picker_page + step)
+
+
+@st.fragment
+def results_view():
+    """Filtro por etiquetas, búsqueda por nombre y lista de resultados (fragmento: no vuelve a pintar el resto)"""
+    result = session_result()
+    if result is None:
+        st.rerun()
     
-    # Si tiene ubicación pero sin fechas = ocupado indefinidamente
-    if device_start is None and device_end is None:
-        return False
+    facets = result.facets
+    tag_counts = facets.tag_counts()
     
-    # Convertir strings de fechas a objetos date para compararlos
-    try:
-        if device_start:
-            device_start_date = datetime.fromisoformat(device_start).date()
-        else:
-            device_start_date = None
-            
-        if device_end:
-            device_end_date = datetime.fromisoformat(device_end).date()
-        else:
-            device_end_date = None
-    except:
-        return False
-    
-    # Verificar si hay solapamiento de fechas
-    if device_start_date and device_end_date:
-        if (start_date <= device_end_date and end_date >= device_start_date):
-            return False
-        else:
-            return True
+    # Filtro por etiquetas (con el número de devices de cada una) y búsqueda por nombre
+    st.markdown("---")
+    tag_col, search_col = st.columns(2)
+    with tag_col:
+        selected_tags = st.multiselect(
+            "🔎 Filtrar por etiqueta",
+            options=list(tag_counts),
+            format_func=lambda tag: f"{tag} ({tag_counts[tag]})",
+            placeholder="Todas las etiquetas"
+        )
+    with search_col:
+        search_text = st.text_input(
+            "🔤 Buscar por nombre",
+            placeholder="Ej: Ultra 01"
+        )
     
-    elif device_start_date and not device_end_date:
-        if end_date >= device_start_date:
-            return False
-        else:
-            return True
+    # Volver a la primera página al cambiar de filtro
+    picker_filter = (tuple(selected_tags), search_text.strip().lower())
+    if st.session_state.picker_filter != picker_filter:
+        st.session_state.picker_filter = picker_filter
+        st.session_state.picker_page = 0
     
-    elif device_end_date and not device_start_date:
-        if start_date <= device_end_date:
-            return False
-        else:
-            return True
+    # Mostrar contador de dispositivos filtrados
+    if selected_tags or search_text.strip():
+        filtered_count = len(facets.search(*picker_filter))
+        st.info(f"📊 Mostrando {filtered_count} de {len(facets.devices)} dispositivos")
     
-    return True
+    device_picker()
 
 
-def get_in_house_locations():
-    """Obtiene locations de tipo In House desde Notion"""
-    url = f"https://api.notion.com/v1/databases/{LOCATIONS_ID}/query"
+@st.fragment
+def device_picker():
+    """Selector paginado de devices y resumen de la selección (fragmento anidado en results_view)"""
+    result = session_result()
+    if result is None:
+        st.rerun()
     
-    payload = {
-        "filter": {
-            "property": "Type",
-            "select": {
-                "equals": "In House"
-            }
-        },
-        "page_size": 100
-    }
+    selected_tags, search_text = st.session_state.picker_filter
+    available_devices_sorted = result.facets.search(selected_tags, search_text)
     
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
+    if len(selected_tags) == 1 and not search_text:
+        filter_label = f"'{selected_tags[0]}'"
+    elif selected_tags or search_text:
+        filter_label = "filtrados"
+    else:
+        filter_label = "Todos"
     
-    locations = []
-    for page in data.get("results", []):
-        props = page["properties"]
-        
-        # Extraer Name (nombre de la ubicación)
-        try:
-            if props.get("Name") and props["Name"]["title"]:
-                name = props["Name"]["title"][0]["text"]["content"]
-            else:
-                name = "Sin nombre"
-        except:
-            name = "Sin nombre"
-        
-        # Extraer Units (número de dispositivos)
-        try:
-            if props.get("Units") and props["Units"]["number"] is not None:
-                device_count = props["Units"]["number"]
-            else:
-                device_count = 0
-        except:
-            device_count = 0
-        
-        locations.append({
-            "id": page["id"],
-            "name": name,
-            "device_count": device_count
-        })
+    total_pages = max(1, math.ceil(len(available_devices_sorted) / DEVICES_PER_PAGE))
+    page = min(st.session_state.picker_page, total_pages - 1)
+    page_devices = available_devices_sorted[page * DEVICES_PER_PAGE:(page + 1) * DEVICES_PER_PAGE]
     
-    return locations
-
-
-# ====================================================
-# 🔹 NUEVA FUNCIÓN: Obtener locations tipo Client
-# ====================================================
-def get_client_locations():
-    """Obtiene locations de tipo Client desde Notion"""
-    url = f"https://api.notion.com/v1/databases/{LOCATIONS_ID}/query"
+    # Selector de dispositivos con checkboxes (solo la página actual)
+    st.markdown("---")
+    st.subheader("Selecciona los dispositivos que quieres asignar")
     
-    # Filtramos solo las locations de tipo "Client"
-    payload = {
-        "filter": {
-            "property": "Type",
-            "select": {
-                "equals": "Client"
-            }
-        },
-        "page_size": 100
-    }
+    select_col, clear_col = st.columns(2)
+    with select_col:
+        st.button(
+            f"☑️ Seleccionar {filter_label} ({len(available_devices_sorted)})",
+            on_click=select_devices,
+            args=(result.mask_of(available_devices_sorted),),
+            use_container_width=True
+        )
+    with clear_col:
+        st.button(
+            "✖️ Quitar selección",
+            on_click=clear_selection,
+            disabled=not st.session_state.selected_mask,
+            use_container_width=True
+        )
     
-    response = requests.post(url, json=payload, headers=headers)
-    data = response.json()
+    device_index = result.device_index
+    selected_mask = st.session_state.selected_mask
+    current_tag = None
     
-    locations = []
-    for page in data.get("results", []):
-        props = page["properties"]
+    for device in page_devices:
+        device_id = device.id
+        position = result.positions[device_id]
+        device_name = device_label(device_index, device_id)
+        checkbox_value = bool(selected_mask >> position & 1)
         
-        # Extraer Name (nombre del cliente/destino)
-        try:
-            if props.get("Name") and props["Name"]["title"]:
-                name = props["Name"]["title"][0]["text"]["content"]
-            else:
-                name = "Sin nombre"
-        except:
-            name = "Sin nombre"
-        
-        # Guardar solo id y nombre (sin device_count)
-        locations.append({
-            "id": page["id"],
-            "name": name
-        })
-    
-    return locations
-# ====================================================
-
-
-def create_in_house_location(name, start_date):
-    """Crea una nueva location In House en Notion"""
-    url = "https://api.notion.com/v1/pages"
+        # Cabecera de grupo cuando cambia la etiqueta
+        if device.tag != current_tag:
+            current_tag = device.tag
+            st.caption(f"🏷️ {current_tag}")
+        
+        # Columnas para checkbox y cajetín
+        inner_col1, inner_col2 = st.columns([0.5, 9.5])
+        
+        with inner_col1:
+            # El estado del checkbox sale de la selección (así "seleccionar todos" se refleja)
+            st.session_state[f"check_{device_id}"] = checkbox_value
+            st.checkbox(
+                device_name,
+                key=f"check_{device_id}",
+                on_change=toggle_device,
+                args=(device_id, position),
+                label_visibility="collapsed"
+            )
+        
+        with inner_col2:
+            # Mostrar solo el nombre (sin tags)
+            st.markdown(
+                f"""
+                <div style='padding: 8px 12px; 
+                            background-color: {"#B3E5E6" if checkbox_value else "#e0e0e0"}; 
+                            border-radius: 6px; 
+                            margin-top: -8px;
+                            margin-bottom: 10px;
+                            border-left: 4px solid {"#00859B" if checkbox_value else "#9e9e9e"};'>
+                    <p style='margin: 0; font-size: 16px; font-weight: 500; color: #333;'>
+                        {device_name}
+                    </p>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
     
-    payload = {
-        "parent": {"database_id": LOCATIONS_ID},
-        "properties": {
-            "Name": {
-                "title": [
-                    {
-                        "text": {
-                            "content": name
-                        }
-                    }
-                ]
-            },
-            "Type": {
-                "select": {
-                    "name": "In House"
-                }
-            },
-            "Start Date": {
-                "date": {
-                    "start": start_date.isoformat()
-                }
-            }
-        }
-    }
+    # Paginación
+    if total_pages > 1:
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            st.button(
+                "◀ Anterior",
+                on_click=change_picker_page,
+                args=(-1,),
+                disabled=page == 0,
+                use_container_width=True
+            )
+        with page_col:
+            st.markdown(
+                f"<p style='text-align: center; margin-top: 8px;'>Página {page + 1} de {total_pages}</p>",
+                unsafe_allow_html=True
+            )
+        with next_col:
+            st.button(
+                "Siguiente ▶",
+                on_click=change_picker_page,
+                args=(1,),
+                disabled=page >= total_pages - 1,
+                use_container_width=True
+            )
     
-    response = requests.post(url, json=payload, headers=headers)
+    # Resumen de la selección
+    if st.session_state.selected_mask:
+        selected_list = ", ".join(
+            device_label(device_index, device_id)
+            for device_id in selected_device_ids(result)
+        )
+        st.info(f"**Seleccionados ({bin(st.session_state.selected_mask).count('1')}):** {selected_list}")
     
-    if response.status_code == 200:
-        data = response.json()
-        st.success(f"✅ Ubicación '{name}' creada correctamente")
-        return data["id"]
-    else:
-        st.error(f"❌ Error al crear ubicación: {response.text}")
-        return None
+    # La app entera solo se vuelve a pintar para mostrar u ocultar el formulario de asignación
+    if bool(st.session_state.selected_mask) != st.session_state.assignment_form_visible:
+        st.rerun()
 
 
-def assign_devices_client(device_names, client_name, start_date, end_date, available_devices):
-    """Asigna dispositivos a un cliente (crea nueva location Client)"""
-    
-    if not client_name or client_name.strip() == "":
-        st.error("⚠️ El nombre del destino no puede estar vacío")
-        return False
-    
-    # 1. Crear la location Client
-    url_location = "https://api.notion.com/v1/pages"
-    
-    payload_location = {
-        "parent": {"database_id": LOCATIONS_ID},
-        "properties": {
-            "Name": {
-                "title": [
-                    {
-                        "text": {
-                            "content": client_name
-                        }
-                    }
-                ]
-            },
-            "Type": {
-                "select": {
-                    "name": "Client"
-                }
-            },
-            "Start Date": {
-                "date": {
-                    "start": start_date.isoformat()
-                }
-            },
-            "End Date": {
-                "date": {
-                    "start": end_date.isoformat()
-                }
-            }
-        }
-    }
+@st.fragment
+def assignment_form():
+    """Formulario de asignación (fragmento: elegir tipo o escribir el nombre no vuelve a pintar la lista)"""
+    st.markdown("---")
+    st.subheader("🎯 Asignar ubicación")
     
-    with st.spinner(f"Creando destino '{client_name}'..."):
-        response_location = requests.post(url_location, json=payload_location, headers=headers)
+    result = session_result()
+    if result is None:
+        st.rerun()
     
-    if response_location.status_code != 200:
-        st.error(f"❌ Error al crear el destino: {response_location.text}")
-        return False
+    # Con Notion caído los datos son de solo lectura: no se puede comprobar ni asignar
+    if get_inventory().last_error:
+        st.warning("⚠️ Notion no responde: la asignación no estará disponible hasta que vuelva a responder")
+        return
     
-    location_data = response_location.json()
-    location_id = location_data["id"]
+    # Selector de tipo de ubicación
+    location_type = st.selectbox(
+        "Tipo de Ubicación",
+        ["Client", "In House"],
+        index=0
+    )
     
-    st.success(f"✅ Destino '{client_name}' creado")
+    # Mostrar fechas según el tipo
+    if location_type == "Client":
+        query_start = st.session_state.query_start_date
+        query_end = st.session_state.query_end_date
+        st.info(f"📅 **Fechas:** {query_start.strftime('%d/%m/%Y')} - {query_end.strftime('%d/%m/%Y')}")
+    else:  # In House
+        today = date.today()
+        st.info(f"📅 **Fecha de inicio:** {today.strftime('%d/%m/%Y')}")
     
-    # 2. Asignar cada dispositivo a esta location
-    success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
+    st.markdown("---")
     
-    progress_bar = st.progress(0)
-    total = len(device_names)
+    # ====================================================
+    # FORMULARIO CLIENT (SOLO CREACIÓN DIRECTA)
+    # ====================================================
+    if location_type == "Client":
+        st.write("**📋 Nuevo Destino Cliente**")
+        
+        # Solo opción de crear nuevo (sin radio buttons ni dropdown)
+        client_name = st.text_input(
+            "Nombre del Destino",
+            placeholder="Ej: Destino Barcelona 2025",
+            key="client_name_input"
+        )
+        
+        if st.button("Crear y Asignar", type="primary", use_container_width=True):
+            query_start = st.session_state.query_start_date
+            query_end = st.session_state.query_end_date
+            
+            job_id = assign_devices_client(
+                selected_device_ids(result),
+                client_name,
+                query_start,
+                query_end,
+                result.device_index
+            )
+            
+            if job_id:
+                finish_assignment(job_id)
+    # ====================================================
     
-    for idx, device_name in enumerate(device_names):
-        # Buscar el device_id en available_devices
-        device_id = None
-        for device in available_devices:
-            if device["Name"] == device_name:
-                device_id = device["id"]
-                break
+    else:
+        # FORMULARIO IN HOUSE (sin cambios)
+        st.write("**🏠 Asignar a In House**")
         
-        if not device_id:
-            st.warning(f"⚠️ No se encontró el ID para '{device_name}'")
-            continue
+        # Obtener locations In House
+        with st.spinner("Cargando ubicaciones In House..."):
+            try:
+                in_house_locations = get_in_house_locations()
+            except requests.RequestException as exc:
+                st.error(f"❌ No se pudieron cargar las ubicaciones: {exc}")
+                st.stop()
         
-        payload_device = {
-            "properties": {
-                "Location": {
-                    "relation": [
-                        {"id": location_id}
-                    ]
-                }
-            }
-        }
+        if not in_house_locations:
+            st.warning("⚠️ No hay ubicaciones In House disponibles")
+            st.info("💡 Crea una nueva ubicación In House")
+            
+            new_in_house_name = st.text_input(
+                "Nombre de la ubicación",
+                placeholder="Ej: Casa Juan",
+                key="new_in_house_name"
+            )
+            
+            if st.button("Crear y Asignar", type="primary", use_container_width=True):
+                job_id = assign_devices_new_in_house(
+                    selected_device_ids(result),
+                    new_in_house_name,
+                    date.today(),
+                    result.device_index
+                )
                 
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
+                if job_id:
+                    finish_assignment(job_id)
         
-        if response_device.status_code == 200:
-            success_count += 1
         else:
-            st.warning(f"⚠️ Error al asignar '{device_name}': {response_device.text}")
-        
-        progress_bar.progress((idx + 1) / total)
+            # Mostrar dropdown con locations existentes (SIN mostrar device_count)
+            location_options = {
+                f"📍 {loc['name']}": loc['id'] 
+                for loc in in_house_locations
+            }
+            
+            selected_location_display = st.selectbox(
+                "Seleccionar ubicación existente",
+                options=list(location_options.keys())
+            )
+            
+            selected_location_id = location_options[selected_location_display]
+            selected_location_name = selected_location_display.replace("📍 ", "")
+            
+            # Opción para crear nueva
+            with st.expander("➕ O crear nueva ubicación In House"):
+                new_in_house_name = st.text_input(
+                    "Nombre de la ubicación",
+                    placeholder="Ej: Casa María",
+                    key="new_in_house_name_alt"
+                )
+                
+                if st.button("Crear y Asignar Nueva", type="secondary", use_container_width=True):
+                    job_id = assign_devices_new_in_house(
+                        selected_device_ids(result),
+                        new_in_house_name,
+                        date.today(),
+                        result.device_index
+                    )
+                    
+                    if job_id:
+                        finish_assignment(job_id)
+            
+            # Botón principal para asignar a existente
+            if st.button("Asignar", type="primary", use_container_width=True):
+                today = date.today()
+                job_id = assign_devices_in_house(
+                    selected_device_ids(result),
+                    selected_location_id,
+                    selected_location_name,
+                    today,
+                    result.device_index
+                )
+                
+                if job_id:
+                    finish_assignment(job_id)
+
+
+JOB_STATUS_LABELS = {
+    "pending": "⏳ En curso",
+    "done": "🎉 Completado",
+    "partial": "⚠️ Completado en parte",
+    "failed": "❌ Fallido",
+}
+
+
+def show_assignment_jobs(statuses):
+    """Estado y progreso de los trabajos de asignación de esta sesión"""
+    for job in statuses:
+        finished = job["done"] + job["failed"]
+        st.write(
+            f"{JOB_STATUS_LABELS[job['status']]} · **{job['location_name']}** · "
+            f"{job['done']} de {job['total']} asignados (trabajo `{job['id'][:8]}`)"
+        )
+        if job["status"] == "pending":
+            st.progress(finished / job["total"] if job["total"] else 0)
+        if job["error"]:
+            st.caption(job["error"])
+        for error in job["errors"]:
+            st.caption(f"⚠️ {error}")
+
+
+@st.fragment(run_every=JOB_STATUS_INTERVAL)
+def assignment_jobs_live():
+    """Estado de los trabajos en curso, refrescado cada pocos segundos (solo este fragmento)"""
+    statuses = get_job_queue().statuses(st.session_state.assignment_jobs)
+    show_assignment_jobs(statuses)
     
-    progress_bar.empty()
+    # Al terminar todos, volver a pintar la app (deja de refrescarse y recarga la disponibilidad)
+    if not any(job["status"] == "pending" for job in statuses):
+        st.rerun()
+
+
+def assignment_jobs_view():
+    """Trabajos de asignación enviados desde esta sesión"""
+    statuses = get_job_queue().statuses(st.session_state.assignment_jobs)
+    if not statuses:
+        return
     
-    if success_count == len(device_names):
-        st.success(f"🎉 ¡Perfecto! {success_count} dispositivos asignados a '{client_name}'")
-        return True
-    elif success_count > 0:
-        st.warning(f"⚠️ Se asignaron {success_count} de {len(device_names)} dispositivos")
-        return True
+    st.subheader("📨 Asignaciones enviadas")
+    if any(job["status"] == "pending" for job in statuses):
+        assignment_jobs_live()
     else:
-        st.error("❌ No se pudo asignar ningún dispositivo")
-        return False
+        show_assignment_jobs(statuses)
+        st.button("✖️ Ocultar", on_click=clear_finished_jobs)
+    st.markdown("---")
 
 
-# ====================================================
-# 🔹 NUEVA FUNCIÓN: Asignar a location Client existente
-# ====================================================
-def assign_devices_to_existing_client(device_names, location_id, location_name, available_devices):
-    """Asigna dispositivos a una location Client existente"""
+def calendar_chart(table, value_title, color_scale):
+    """Heatmap de una tabla filas × días"""
+    data = table.rename_axis(index="Fila", columns="Día").stack().rename(value_title).reset_index()
     
-    success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
+    return alt.Chart(data).mark_rect().encode(
+        x=alt.X("yearmonthdate(Día):O", title=None, axis=alt.Axis(format="%d/%m", labelAngle=-90)),
+        y=alt.Y("Fila:N", title=None, sort=list(table.index)),
+        color=alt.Color(f"{value_title}:Q", scale=color_scale),
+        tooltip=[
+            alt.Tooltip("Fila:N", title=""),
+            alt.Tooltip("yearmonthdate(Día):T", title="Día", format="%d/%m/%Y"),
+            alt.Tooltip(f"{value_title}:Q"),
+        ]
+    ).properties(height=max(120, 20 * len(table.index)))
+
+
+@st.fragment
+def availability_calendar():
+    """Calendario de las próximas semanas: dispositivos libres cada día, por etiqueta o por device (fragmento)"""
+    if not st.toggle("📅 Ver calendario de disponibilidad"):
+        return
     
-    progress_bar = st.progress(0)
-    total = len(device_names)
+    try:
+        inventory = get_inventory().refresh()
+    except requests.RequestException as exc:
+        st.error(f"❌ No se pudo consultar Notion: {exc}")
+        return
     
-    for idx, device_name in enumerate(device_names):
-        # Buscar el device_id en available_devices
-        device_id = None
-        for device in available_devices:
-            if device["Name"] == device_name:
-                device_id = device["id"]
-                break
-        
-        if not device_id:
-            st.warning(f"⚠️ No se encontró el ID para '{device_name}'")
-            continue
-        
-        # Asignar el dispositivo a la location existente
-        payload_device = {
-            "properties": {
-                "Location": {
-                    "relation": [
-                        {"id": location_id}
-                    ]
-                }
-            }
-        }
-        
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
-        
-        if response_device.status_code == 200:
-            success_count += 1
-        else:
-            st.warning(f"⚠️ Error al asignar '{device_name}': {response_device.text}")
-        
-        progress_bar.progress((idx + 1) / total)
+    weeks_col, view_col = st.columns(2)
+    with weeks_col:
+        weeks = st.slider("Semanas", min_value=1, max_value=CALENDAR_MAX_WEEKS, value=4)
     
-    progress_bar.empty()
+    calendar = inventory.availability_calendar(date.today(), weeks * 7)
     
-    if success_count == len(device_names):
-        st.success(f"🎉 ¡Perfecto! {success_count} dispositivos asignados a '{location_name}'")
-        return True
-    elif success_count > 0:
-        st.warning(f"⚠️ Se asignaron {success_count} de {len(device_names)} dispositivos")
-        return True
+    with view_col:
+        view = st.selectbox(
+            "Ver",
+            [None, *calendar.tags()],
+            format_func=lambda tag: "Por etiqueta" if tag is None else f"Dispositivos de '{tag}'"
+        )
+    
+    if view is None:
+        table = calendar.free_by_tag()
+        st.altair_chart(calendar_chart(table, "Libres", alt.Scale(scheme="greens")), use_container_width=True)
     else:
-        st.error("❌ No se pudo asignar ningún dispositivo")
-        return False
-# ====================================================
+        table = calendar.free_by_device(view)
+        
+        # Los devices libres todo el periodo no aportan nada al calendario
+        busy_rows = table.min(axis=1) == 0
+        if busy_rows.any():
+            chart = calendar_chart(table[busy_rows], "Libre", alt.Scale(domain=[0, 1], range=["#e45756", "#54a24b"]))
+            st.altair_chart(chart, use_container_width=True)
+        if not busy_rows.all():
+            st.caption(f"✅ {int((~busy_rows).sum())} dispositivos de '{view}' libres todo el periodo (no se muestran)")
 
 
-def assign_devices_in_house(device_names, location_id, location_name, start_date, available_devices):
-    """Asigna dispositivos a una ubicación In House existente"""
+@st.fragment
+def earliest_window_finder():
+    """Buscador de la primera fecha en que hay N dispositivos de una etiqueta libres X días"""
+    if not st.toggle("🔭 Buscar la primera fecha con unidades libres"):
+        return
     
-    success_count = 0
-    url_patch = "https://api.notion.com/v1/pages/"
+    try:
+        inventory = get_inventory().refresh()
+    except requests.RequestException as exc:
+        st.error(f"❌ No se pudo consultar Notion: {exc}")
+        return
     
-    progress_bar = st.progress(0)
-    total = len(device_names)
+    devices, _ = inventory.bookings()
+    tag_col, quantity_col, duration_col = st.columns(3)
+    with tag_col:
+        tag = st.selectbox("Etiqueta", tags_of(devices))
+    with quantity_col:
+        quantity = st.number_input("Unidades", min_value=1, value=1, step=1)
+    with duration_col:
+        duration = st.number_input("Días", min_value=1, max_value=WINDOW_SEARCH_DAYS, value=5, step=1)
     
-    for idx, device_name in enumerate(device_names):
-        # Buscar el device_id en available_devices
-        device_id = None
-        for device in available_devices:
-            if device["Name"] == device_name:
-                device_id = device["id"]
-                break
-        
-        if not device_id:
-            st.warning(f"⚠️ No se encontró el ID para '{device_name}'")
-            continue
-        
-        payload_device = {
-            "properties": {
-                "Location": {
-                    "relation": [
-                        {"id": location_id}
-                    ]
-                }
-            }
-        }
-        
-        response_device = requests.patch(f"{url_patch}{device_id}", json=payload_device, headers=headers)
-        
-        if response_device.status_code == 200:
-            success_count += 1
-        else:
-            st.warning(f"⚠️ Error al asignar '{device_name}': {response_device.text}")
-        
-        progress_bar.progress((idx + 1) / total)
+    if not st.button("Buscar fechas", use_container_width=True):
+        return
     
-    progress_bar.empty()
+    windows = inventory.earliest_windows(tag, int(quantity), int(duration), date.today())
+    if not windows:
+        st.warning(f"⚠️ No hay {quantity} dispositivos de '{tag}' libres {duration} días seguidos en los próximos {WINDOW_SEARCH_DAYS} días")
+        return
     
-    if success_count == len(device_names):
-        st.success(f"🎉 ¡Perfecto! {success_count} dispositivos asignados a '{location_name}'")
-        return True
-    elif success_count > 0:
-        st.warning(f"⚠️ Se asignaron {success_count} de {len(device_names)} dispositivos")
-        return True
-    else:
-        st.error("❌ No se pudo asignar ningún dispositivo")
-        return False
+    device_index = build_device_index(devices)
+    for window in windows:
+        title = (
+            f"📅 Del {window['start'].strftime('%d/%m/%Y')} al {window['end'].strftime('%d/%m/%Y')}"
+            f" (se puede empezar hasta el {window['latest_start'].strftime('%d/%m/%Y')})"
+        )
+        with st.expander(title):
+            st.caption(", ".join(device_label(device_index, device_id) for device_id in window["device_ids"]))
 
 
 # Inicializar estado de sesión (para mantener datos entre clics)
-if 'selected_devices' not in st.session_state:
-    st.session_state.selected_devices = []
+if 'selected_mask' not in st.session_state:
+    st.session_state.selected_mask = 0
 
 if 'search_completed' not in st.session_state:
     st.session_state.search_completed = False
 
-if 'available_devices' not in st.session_state:
-    st.session_state.available_devices = []
+if 'result_version' not in st.session_state:
+    st.session_state.result_version = None
+
+if 'picker_page' not in st.session_state:
+    st.session_state.picker_page = 0
+
+if 'picker_filter' not in st.session_state:
+    st.session_state.picker_filter = ((), "")
+
+if 'assignment_form_visible' not in st.session_state:
+    st.session_state.assignment_form_visible = False
+
+if 'assignment_jobs' not in st.session_state:
+    st.session_state.assignment_jobs = []
 
 if 'query_start_date' not in st.session_state:
     st.session_state.query_start_date = date.today()
@@ -551,6 +2318,12 @@ if 'query_end_date' not in st.session_state:
     st.session_state.query_end_date = date.today()
 
 
+# Arrancar la cola de asignaciones (su worker retoma lo pendiente tras un reinicio)
+get_job_queue()
+
+# Trabajos de asignación en curso o terminados (se ejecutan en segundo plano)
+assignment_jobs_view()
+
 # Interfaz de fechas (selector de inicio y fin)
 col1, col2 = st.columns(2)
 
@@ -576,269 +2349,66 @@ if start_date > end_date:
 # Botón de búsqueda
 if st.button("🔍 Consultar Disponibilidad", type="primary", use_container_width=True):
     with st.spinner("Consultando dispositivos..."):
-        # Obtener todos los devices de Notion
-        pages = get_pages(DEVICES_ID)
-        all_devices = [extract_device_data(page) for page in pages]
-        
-        # Filtrar solo los disponibles
-        available_devices = [
-            device for device in all_devices 
-            if check_availability(device, start_date, end_date)
-        ]
+        # Inventario compartido (solo va a Notion si no está en memoria)
+        try:
+            inventory = get_inventory().refresh()
+        except requests.RequestException as exc:
+            st.error(f"❌ No se pudo consultar Notion: {exc}")
+            st.stop()
         
-        # Guardar en session_state
-        st.session_state.available_devices = available_devices
+        # Filtrar solo los disponibles con el índice de intervalos (resultado compartido entre sesiones)
+        result = inventory.query_result(start_date, end_date)
+        
+        # Guardar en session_state solo la consulta, no los devices
         st.session_state.query_start_date = start_date
         st.session_state.query_end_date = end_date
+        st.session_state.result_version = result.version
         st.session_state.search_completed = True
-        st.session_state.selected_devices = []
+        st.session_state.selected_mask = 0
+        st.session_state.picker_page = 0
 
 # Mostrar resultados si la búsqueda se completó
 if st.session_state.search_completed:
-    available_devices = st.session_state.available_devices
+    result = session_result()
     
-    if available_devices:
-        st.success(f"✅ Hay {len(available_devices)} dispositivos disponibles")
-        
-        # Obtener tags únicos para el filtro
-        unique_tags = set()
-        for device in available_devices:
-            if device["Tags"] and device["Tags"] != "Sin tag":
-                unique_tags.add(device["Tags"])
-        
-        unique_tags = sorted(unique_tags)
-        filter_options = ["Todos"] + unique_tags
-        
-        # Selector de filtro por Tag
-        st.markdown("---")
-        selected_tag = st.selectbox(
-            "🔎 Filtrar por etiqueta",
-            options=filter_options,
-            index=0
-        )
-        
-        # Aplicar filtro
-        if selected_tag == "Todos":
-            filtered_devices = available_devices
-        else:
-            filtered_devices = [d for d in available_devices if d["Tags"] == selected_tag]
-        
-        # Mostrar contador de dispositivos filtrados
-        if selected_tag != "Todos":
-            st.info(f"📊 Mostrando {len(filtered_devices)} dispositivos con etiqueta '{selected_tag}'")
-        
-        # Ordenar alfabéticamente
-        available_devices_sorted = sorted(filtered_devices, key=lambda d: d["Name"])
-        
-        # Selector de dispositivos con checkboxes
-        st.markdown("---")
-        st.subheader("Selecciona los dispositivos que quieres asignar")
+    # Antigüedad de los datos (y aviso si Notion no está respondiendo)
+    inventory = get_inventory()
+    as_of = inventory.as_of()
+    if inventory.last_error:
+        saved_at = f" del {as_of.strftime('%d/%m/%Y %H:%M')}" if as_of else ""
+        st.warning(f"⚠️ Notion no responde: mostrando los datos guardados{saved_at} (solo lectura)")
+    elif as_of:
+        st.caption(f"🕒 Datos de Notion a {as_of.strftime('%d/%m/%Y %H:%M')}")
+    
+    # Propiedades de Notion con un formato inesperado (se usaron valores por defecto)
+    schema_warnings = inventory.schema_warnings()
+    if schema_warnings:
+        with st.expander(f"⚠️ {len(schema_warnings)} avisos de formato en los datos de Notion"):
+            for message in schema_warnings:
+                st.caption(message)
+    
+    if result is None:
+        # El inventario cambió y el resultado de esta consulta ya no está en memoria
+        st.session_state.search_completed = False
+        st.session_state.selected_mask = 0
+        st.warning("⚠️ Los datos de Notion han cambiado desde la consulta: vuelve a consultar la disponibilidad")
+    
+    elif result.devices:
+        st.success(f"✅ Hay {len(result.devices)} dispositivos disponibles")
         
-        for device in available_devices_sorted:
-            device_name = device["Name"]
-            
-            # Columnas para checkbox y cajetín
-            inner_col1, inner_col2 = st.columns([0.5, 9.5])
-            
-            with inner_col1:
-                # Checkbox para seleccionar
-                checkbox_value = st.checkbox(
-                    "",
-                    value=device_name in st.session_state.selected_devices,
-                    key=f"check_{device_name}",
-                    label_visibility="collapsed"
-                )
-                
-                # Actualizar lista de seleccionados
-                if checkbox_value and device_name not in st.session_state.selected_devices:
-                    st.session_state.selected_devices.append(device_name)
-                elif not checkbox_value and device_name in st.session_state.selected_devices:
-                    st.session_state.selected_devices.remove(device_name)
-            
-            with inner_col2:
-                # Mostrar solo el nombre (sin tags)
-                st.markdown(
-                    f"""
-                    <div style='padding: 8px 12px; 
-                                background-color: {"#B3E5E6" if checkbox_value else "#e0e0e0"}; 
-                                border-radius: 6px; 
-                                margin-top: -8px;
-                                border-left: 4px solid {"#00859B" if checkbox_value else "#9e9e9e"};'>
-                        <p style='margin: 0; font-size: 16px; font-weight: 500; color: #333;'>
-                            {device_name}
-                        </p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-            
-            st.markdown("<div style='margin-bottom: 10px;'></div>", unsafe_allow_html=True)
+        # El formulario solo aparece con dispositivos seleccionados (ver device_picker)
+        st.session_state.assignment_form_visible = bool(st.session_state.selected_mask)
+        results_view()
         
-        # Mostrar formulario de asignación si hay dispositivos seleccionados
-        if st.session_state.selected_devices:
-            st.markdown("---")
-            st.subheader(f"🎯 Asignar ubicación ({len(st.session_state.selected_devices)} dispositivos)")
-            
-            # Selector de tipo de ubicación
-            location_type = st.selectbox(
-                "Tipo de Ubicación",
-                ["Client", "In House"],
-                index=0
-            )
-            
-            # Información de dispositivos seleccionados
-            selected_list = ", ".join(st.session_state.selected_devices)
-            st.info(f"**Seleccionados:** {selected_list}")
-            
-            # Mostrar fechas según el tipo
-            if location_type == "Client":
-                query_start = st.session_state.query_start_date
-                query_end = st.session_state.query_end_date
-                st.info(f"📅 **Fechas:** {query_start.strftime('%d/%m/%Y')} - {query_end.strftime('%d/%m/%Y')}")
-            else:  # In House
-                today = date.today()
-                st.info(f"📅 **Fecha de inicio:** {today.strftime('%d/%m/%Y')}")
-            
-            st.markdown("---")
-            
-            # ====================================================
-            # FORMULARIO CLIENT (SOLO CREACIÓN DIRECTA)
-            # ====================================================
-            if location_type == "Client":
-                st.write("**📋 Nuevo Destino Cliente**")
-                
-                # Solo opción de crear nuevo (sin radio buttons ni dropdown)
-                client_name = st.text_input(
-                    "Nombre del Destino",
-                    placeholder="Ej: Destino Barcelona 2025",
-                    key="client_name_input"
-                )
-                
-                if st.button("Crear y Asignar", type="primary", use_container_width=True):
-                    query_start = st.session_state.query_start_date
-                    query_end = st.session_state.query_end_date
-                    
-                    success = assign_devices_client(
-                        st.session_state.selected_devices,
-                        client_name,
-                        query_start,
-                        query_end,
-                        st.session_state.available_devices
-                    )
-                    
-                    if success:
-                        st.session_state.selected_devices = []
-                        st.session_state.search_completed = False
-                        st.session_state.available_devices = []
-                        st.rerun()
-            # ====================================================
-            
-            else:
-                # FORMULARIO IN HOUSE (sin cambios)
-                st.write("**🏠 Asignar a In House**")
-                
-                # Obtener locations In House
-                with st.spinner("Cargando ubicaciones In House..."):
-                    in_house_locations = get_in_house_locations()
-                
-                if not in_house_locations:
-                    st.warning("⚠️ No hay ubicaciones In House disponibles")
-                    st.info("💡 Crea una nueva ubicación In House")
-                    
-                    new_in_house_name = st.text_input(
-                        "Nombre de la ubicación",
-                        placeholder="Ej: Casa Juan",
-                        key="new_in_house_name"
-                    )
-                    
-                    if st.button("Crear y Asignar", type="primary", use_container_width=True):
-                        if not new_in_house_name or new_in_house_name.strip() == "":
-                            st.error("⚠️ El nombre no puede estar vacío")
-                        else:
-                            today = date.today()
-                            with st.spinner("Creando ubicación..."):
-                                location_id = create_in_house_location(new_in_house_name, today)
-                            
-                            if location_id:
-                                success = assign_devices_in_house(
-                                    st.session_state.selected_devices,
-                                    location_id,
-                                    new_in_house_name,
-                                    today,
-                                    st.session_state.available_devices
-                                )
-                                
-                                if success:
-                                    st.session_state.selected_devices = []
-                                    st.session_state.search_completed = False
-                                    st.session_state.available_devices = []
-                                    st.rerun()
-                
-                else:
-                    # Mostrar dropdown con locations existentes (SIN mostrar device_count)
-                    location_options = {
-                        f"📍 {loc['name']}": loc['id'] 
-                        for loc in in_house_locations
-                    }
-                    
-                    selected_location_display = st.selectbox(
-                        "Seleccionar ubicación existente",
-                        options=list(location_options.keys())
-                    )
-                    
-                    selected_location_id = location_options[selected_location_display]
-                    selected_location_name = selected_location_display.replace("📍 ", "")
-                    
-                    # Opción para crear nueva
-                    with st.expander("➕ O crear nueva ubicación In House"):
-                        new_in_house_name = st.text_input(
-                            "Nombre de la ubicación",
-                            placeholder="Ej: Casa María",
-                            key="new_in_house_name_alt"
-                        )
-                        
-                        if st.button("Crear y Asignar Nueva", type="secondary", use_container_width=True):
-                            if not new_in_house_name or new_in_house_name.strip() == "":
-                                st.error("⚠️ El nombre no puede estar vacío")
-                            else:
-                                today = date.today()
-                                with st.spinner("Creando ubicación..."):
-                                    location_id = create_in_house_location(new_in_house_name, today)
-                                
-                                if location_id:
-                                    success = assign_devices_in_house(
-                                        st.session_state.selected_devices,
-                                        location_id,
-                                        new_in_house_name,
-                                        today,
-                                        st.session_state.available_devices
-                                    )
-                                    
-                                    if success:
-                                        st.session_state.selected_devices = []
-                                        st.session_state.search_completed = False
-                                        st.session_state.available_devices = []
-                                        st.rerun()
-                    
-                    # Botón principal para asignar a existente
-                    if st.button("Asignar", type="primary", use_container_width=True):
-                        today = date.today()
-                        success = assign_devices_in_house(
-                            st.session_state.selected_devices,
-                            selected_location_id,
-                            selected_location_name,
-                            today,
-                            st.session_state.available_devices
-                        )
-                        
-                        if success:
-                            st.session_state.selected_devices = []
-                            st.session_state.search_completed = False
-                            st.session_state.available_devices = []
-                            st.rerun()
+        if st.session_state.assignment_form_visible:
+            assignment_form()
     
     else:
         st.warning("⚠️ No hay dispositivos disponibles en estas fechas")
 
 else:
-    st.info("👆 Selecciona las fechas y haz clic en 'Consultar Disponibilidad'")
\ No newline at end of file
+    st.info("👆 Selecciona las fechas y haz clic en 'Consultar Disponibilidad'")
+
+st.markdown("---")
+availability_calendar()
+earliest_window_finder()
\ No newline at end of file
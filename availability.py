@@ -0,0 +1,167 @@
+"""Motores de disponibilidad de los devices, sin dependencias de Streamlit (se pueden probar por separado)"""
+from bisect import bisect_right
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+@lru_cache(maxsize=4096)
+def parse_iso_date(value):
+    """Fecha ISO de Notion a date (muchos devices comparten las fechas de la misma Location)"""
+    return datetime.fromisoformat(value).date()
+
+
+def parse_booking_dates(device_start, device_end):
+    """Convierte las fechas ISO de la reserva a date (una fecha inválida = ocupado indefinidamente)"""
+    try:
+        device_start_date = parse_iso_date(device_start) if device_start else None
+        device_end_date = parse_iso_date(device_end) if device_end else None
+    except (TypeError, ValueError):
+        return date.min, date.max
+    
+    return device_start_date, device_end_date
+
+
+def location_interval(location):
+    """Intervalo (inicio, fin) de una reserva; sin fechas, o en el extremo que falte, abierto (date.min / date.max)"""
+    start_date, end_date = parse_booking_dates(location["start"], location["end"])
+    return (start_date or date.min, end_date or date.max)
+
+
+def join_bookings(devices, locations_by_id):
+    """Reservas de cada device (tupla de intervalos ordenados), en el mismo orden que devices"""
+    intervals_by_location = {}
+    bookings = []
+    
+    for device in devices:
+        if not device.location_ids:
+            bookings.append(())
+            continue
+        
+        intervals = []
+        for location_id in device.location_ids:
+            interval = intervals_by_location.get(location_id)
+            if interval is None:
+                # Una location que no está en la copia local cuenta como ocupado indefinidamente
+                location = locations_by_id.get(location_id)
+                interval = location_interval(location) if location else (date.min, date.max)
+                intervals_by_location[location_id] = interval
+            intervals.append(interval)
+        bookings.append(tuple(sorted(intervals)))
+    
+    return bookings
+
+
+def check_availability(bookings, start_date, end_date):
+    """Verifica si un dispositivo está disponible en el rango de fechas solicitado"""
+    
+    # Sin reservas = está disponible; si no, no puede solaparse con ninguna
+    for booking_start, booking_end in bookings:
+        if start_date <= booking_end and end_date >= booking_start:
+            return False
+    
+    return True
+
+
+def clashing_reservations(reservations, start_date, end_date):
+    """Nombres de las reservas (nombre, intervalo) que se solapan con el rango solicitado"""
+    return [name for name, interval in reservations if not check_availability([interval], start_date, end_date)]
+
+
+class AvailabilityIndex:
+    """Índice de intervalos de reserva para consultar disponibilidad sin recorrer cada device"""
+    
+    def __init__(self, devices, bookings):
+        self.devices = devices
+        
+        # Un intervalo por reserva: un device con varias reservas aparece varias veces
+        intervals = [
+            (booking_start, booking_end, position)
+            for position, device_bookings in enumerate(bookings)
+            for booking_start, booking_end in device_bookings
+        ]
+        intervals.sort()
+        
+        self.starts = [interval[0] for interval in intervals]
+        self.owners = [interval[2] for interval in intervals]
+        
+        # Árbol de segmentos (en array) con el máximo de las fechas de fin
+        self.size = 1
+        while self.size < len(intervals):
+            self.size *= 2
+        self.max_end = [date.min] * (2 * self.size)
+        for leaf, interval in enumerate(intervals):
+            self.max_end[self.size + leaf] = interval[1]
+        for node in range(self.size - 1, 0, -1):
+            self.max_end[node] = max(self.max_end[2 * node], self.max_end[2 * node + 1])
+    
+    def busy_positions(self, start_date, end_date):
+        """Posiciones de los devices con una reserva que se solapa con [start_date, end_date]"""
+        # Solo los intervalos que empiezan antes del fin pedido, y solo las ramas
+        # del árbol que terminan después del inicio pedido
+        limit = bisect_right(self.starts, end_date)
+        busy = set()
+        if not limit:
+            return busy
+        
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, low, high = stack.pop()
+            if low >= limit or self.max_end[node] < start_date:
+                continue
+            if node >= self.size:
+                busy.add(self.owners[low])
+            else:
+                middle = (low + high) // 2
+                stack.append((2 * node, low, middle))
+                stack.append((2 * node + 1, middle, high))
+        
+        return busy
+    
+    def available(self, start_date, end_date):
+        """Devices libres en [start_date, end_date], en el mismo orden que el inventario"""
+        busy = self.busy_positions(start_date, end_date)
+        return [device for position, device in enumerate(self.devices) if position not in busy]
+
+
+class VectorAvailability:
+    """Motor vectorizado (NumPy) para consultas de disponibilidad en bloque, sin bucles por device"""
+    
+    def __init__(self, devices, bookings):
+        self.devices = devices
+        self.tag_codes = np.array([device.tag_code for device in devices], dtype=np.int32)
+        
+        intervals = [
+            (booking_start, booking_end, position)
+            for position, device_bookings in enumerate(bookings)
+            for booking_start, booking_end in device_bookings
+        ]
+        self.starts = np.array([interval[0] for interval in intervals], dtype="datetime64[D]")
+        self.ends = np.array([interval[1] for interval in intervals], dtype="datetime64[D]")
+        self.owners = np.array([interval[2] for interval in intervals], dtype=np.intp)
+    
+    def availability_matrix(self, date_ranges):
+        """Matriz M×N de disponibilidad: fila i = devices libres en date_ranges[i]"""
+        range_starts = np.array([start for start, _ in date_ranges], dtype="datetime64[D]")[:, None]
+        range_ends = np.array([end for _, end in date_ranges], dtype="datetime64[D]")[:, None]
+        
+        overlaps = (self.starts[None, :] <= range_ends) & (self.ends[None, :] >= range_starts)
+        busy = np.zeros((len(date_ranges), len(self.devices)), dtype=bool)
+        np.logical_or.at(busy, (slice(None), self.owners), overlaps)
+        return ~busy
+    
+    def available(self, start_date, end_date):
+        """Devices libres en [start_date, end_date], en el mismo orden que el inventario"""
+        mask = self.availability_matrix([(start_date, end_date)])[0]
+        return [self.devices[position] for position in np.flatnonzero(mask)]
+    
+    def free_counts_by_tag(self, date_ranges):
+        """Devices libres por etiqueta (columnas) para cada rango de fechas (filas)"""
+        matrix = self.availability_matrix(date_ranges)
+        counts = pd.DataFrame(matrix.T, index=self.tag_codes).groupby(level=0).sum().T
+        tag_names = {device.tag_code: device.tag for device in self.devices}
+        counts.columns = [tag_names[code] for code in counts.columns]
+        counts.index = [f"{start.isoformat()} - {end.isoformat()}" for start, end in date_ranges]
+        return counts
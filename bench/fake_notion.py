@@ -0,0 +1,475 @@
+"""Servidor local que imita la API de Notion que usa app.py.
+
+Implementa solo lo que necesita la app:
+
+- POST  /v1/databases/{id}/query   (filtros, paginación con cursor, filter_properties)
+- GET   /v1/databases/{id}         (esquema de propiedades)
+- GET   /v1/pages/{id}
+- GET   /v1/pages/{id}/properties/{property_id}   (relaciones completas, paginadas)
+- POST  /v1/pages                  (crear location)
+- PATCH /v1/pages/{id}             (asignar Location a un device)
+
+Los datos (Devices y Locations) se generan al arrancar con el tamaño pedido, y
+se puede inyectar latencia y respuestas 429 para reproducir el comportamiento
+real de Notion. Para usar la app contra él:
+
+    python bench/fake_notion.py --devices 5000 --port 8765
+    NOTION_TOKEN=fake NOTION_API_URL=http://127.0.0.1:8765/v1 streamlit run app.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# Mismos IDs que app.py, para no tener que tocar la configuración de la app
+DEVICES_ID = "43e15b677c8c4bd599d7c602f281f1da"
+LOCATIONS_ID = "28758a35e4118045abe6e37534c44974"
+
+DEVICE_TAGS = ["Ultra", "Neo 4", "Quest 3", "Pico 4", None]
+
+# Elementos de una relación que Notion incluye en una página o en una consulta
+RELATION_LIMIT = 25
+
+# IDs de propiedad (Notion los usa en filter_properties)
+PROPERTY_IDS = {
+    DEVICES_ID: {
+        "Name": "title",
+        "Tags": "tags",
+        "Location": "locr",
+        "Start Date": "sdro",
+        "End Date": "edro",
+    },
+    LOCATIONS_ID: {
+        "Name": "title",
+        "Type": "type",
+        "Start Date": "sdat",
+        "End Date": "edat",
+        "Units": "unit",
+    },
+}
+
+
+def notion_timestamp():
+    """last_edited_time al estilo Notion (redondeado al minuto)"""
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    return now.strftime("%Y-%m-%dT%H:%M:00.000Z")
+
+
+def date_value(value):
+    return {"start": value, "end": None, "time_zone": None} if value else None
+
+
+class FakeNotionData:
+    """Devices y Locations en memoria, con el formato de página de la API de Notion"""
+
+    def __init__(self, devices=1000, locations=None, booked_ratio=0.4, seed=1, extra_properties=0, max_bookings=1):
+        rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pages = {}
+        # Propiedades de texto que la app no lee (las bases de datos reales tienen muchas)
+        self.extra_properties = {f"Extra {number}": f"xp{number:02d}" for number in range(extra_properties)}
+
+        today = date.today()
+        location_ids = []
+        for number in range(locations or max(10, devices // 10)):
+            location_type = "In House" if number % 4 == 0 else "Client"
+            start = today + timedelta(days=rnd.randint(-60, 120))
+            end = start + timedelta(days=rnd.randint(1, 14)) if location_type == "Client" else None
+            page_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+            self.pages[page_id] = {
+                "database_id": LOCATIONS_ID,
+                "id": page_id,
+                "Name": f"Location {number:05d}",
+                "Type": location_type,
+                "Start Date": start.isoformat(),
+                "End Date": end.isoformat() if end else None,
+                "Units": None,
+                "last_edited_time": notion_timestamp(),
+            }
+            location_ids.append(page_id)
+
+        for number in range(devices):
+            page_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+            booked = location_ids and rnd.random() < booked_ratio
+            self.pages[page_id] = {
+                "database_id": DEVICES_ID,
+                "id": page_id,
+                "Name": f"Device {number:05d}",
+                "Tags": rnd.choice(DEVICE_TAGS),
+                "Location": self.pick_locations(rnd, location_ids, max_bookings) if booked else [],
+                "last_edited_time": notion_timestamp(),
+            }
+
+    @staticmethod
+    def pick_locations(rnd, location_ids, max_bookings):
+        """Locations enlazadas a un device reservado (entre 1 y max_bookings reservas)"""
+        if max_bookings <= 1:
+            return [rnd.choice(location_ids)]
+        return rnd.sample(location_ids, min(len(location_ids), rnd.randint(1, max_bookings)))
+
+    def rollup(self, page, key):
+        """Rollup 'show_original' de una fecha de las Locations enlazadas"""
+        items = []
+        for location_id in page["Location"]:
+            location = self.pages.get(location_id)
+            value = location[key] if location else None
+            items.append({"type": "date", "date": date_value(value)})
+        return {"type": "array", "array": items, "function": "show_original"}
+
+    def property_ids(self, database_id):
+        return {**PROPERTY_IDS[database_id], **self.extra_properties}
+
+    def render(self, page, only=None):
+        """Página en formato JSON de la API (opcionalmente solo algunas propiedades)"""
+        ids = self.property_ids(page["database_id"])
+        title = [{"type": "text", "text": {"content": page["Name"], "link": None}, "plain_text": page["Name"]}]
+
+        if page["database_id"] == LOCATIONS_ID:
+            values = {
+                "Name": {"type": "title", "title": title},
+                "Type": {"type": "select", "select": {"name": page["Type"]} if page["Type"] else None},
+                "Start Date": {"type": "date", "date": date_value(page["Start Date"])},
+                "End Date": {"type": "date", "date": date_value(page["End Date"])},
+                "Units": {"type": "number", "number": page["Units"]},
+            }
+        else:
+            values = {
+                "Name": {"type": "title", "title": title},
+                "Tags": {"type": "select", "select": {"name": page["Tags"]} if page["Tags"] else None},
+                # Como Notion: solo las RELATION_LIMIT primeras, el resto por el endpoint de propiedades
+                "Location": {
+                    "type": "relation",
+                    "relation": [{"id": i} for i in page["Location"][:RELATION_LIMIT]],
+                    "has_more": len(page["Location"]) > RELATION_LIMIT,
+                },
+                "Start Date": {"type": "rollup", "rollup": self.rollup(page, "Start Date")},
+                "End Date": {"type": "rollup", "rollup": self.rollup(page, "End Date")},
+            }
+
+        for name in self.extra_properties:
+            text = f"{name} de {page['Name']}"
+            values[name] = {"type": "rich_text", "rich_text": [
+                {"type": "text", "text": {"content": text, "link": None}, "plain_text": text}
+            ]}
+
+        properties = {}
+        for name, value in values.items():
+            if only and ids[name] not in only and name not in only:
+                continue
+            properties[name] = {"id": ids[name], **value}
+
+        return {
+            "object": "page",
+            "id": page["id"],
+            "created_time": page.get("created_time", page["last_edited_time"]),
+            "last_edited_time": page["last_edited_time"],
+            "archived": False,
+            "in_trash": False,
+            "parent": {"type": "database_id", "database_id": page["database_id"]},
+            "properties": properties,
+        }
+
+    def matches(self, page, condition):
+        """Evalúa el subconjunto de filtros de Notion que usa la app"""
+        if not condition:
+            return True
+        if "and" in condition:
+            return all(self.matches(page, part) for part in condition["and"])
+        if "or" in condition:
+            return any(self.matches(page, part) for part in condition["or"])
+
+        if condition.get("timestamp") in ("last_edited_time", "created_time"):
+            timestamp = condition["timestamp"]
+            edited = page.get(timestamp, page["last_edited_time"])[:16]
+            rule = condition[timestamp]
+            if "after" in rule:
+                return edited > rule["after"][:16]
+            if "on_or_after" in rule:
+                return edited >= rule["on_or_after"][:16]
+            raise ValueError(f"Filtro no soportado: {condition}")
+
+        value = page.get(condition["property"])
+        if "title" in condition:
+            rule = condition["title"]
+            if "equals" in rule:
+                return value == rule["equals"]
+        if "select" in condition:
+            rule = condition["select"]
+            if "equals" in rule:
+                return value == rule["equals"]
+            if "does_not_equal" in rule:
+                return value != rule["does_not_equal"]
+            if "is_empty" in rule:
+                return value is None
+            if "is_not_empty" in rule:
+                return value is not None
+        if "relation" in condition:
+            rule = condition["relation"]
+            if "contains" in rule:
+                return rule["contains"] in value
+            if "does_not_contain" in rule:
+                return rule["does_not_contain"] not in value
+            if "is_empty" in rule:
+                return not value
+            if "is_not_empty" in rule:
+                return bool(value)
+        if "date" in condition:
+            rule = condition["date"]
+            if "is_empty" in rule:
+                return value is None
+            if "is_not_empty" in rule:
+                return value is not None
+            if "on_or_after" in rule:
+                return value is not None and value >= rule["on_or_after"]
+            if "on_or_before" in rule:
+                return value is not None and value <= rule["on_or_before"]
+        raise ValueError(f"Filtro no soportado: {condition}")
+
+    def query(self, database_id, body, only=None):
+        with self.lock:
+            rows = [
+                page for page in self.pages.values()
+                if page["database_id"] == database_id and self.matches(page, body.get("filter"))
+            ]
+            rows.sort(key=lambda page: page["id"])
+
+            start = int(body.get("start_cursor") or 0)
+            size = min(int(body.get("page_size", 100)), 100)
+            has_more = start + size < len(rows)
+            return {
+                "object": "list",
+                "results": [self.render(page, only) for page in rows[start:start + size]],
+                "has_more": has_more,
+                "next_cursor": str(start + size) if has_more else None,
+            }
+
+    def create(self, body):
+        properties = body["properties"]
+
+        def date_property(name):
+            value = properties.get(name)
+            return value["date"]["start"] if value and value.get("date") else None
+
+        page_id = str(uuid.uuid4())
+        page = {
+            "database_id": body["parent"]["database_id"].replace("-", ""),
+            "id": page_id,
+            "Name": properties["Name"]["title"][0]["text"]["content"],
+            "Type": (properties.get("Type") or {}).get("select", {}).get("name"),
+            "Start Date": date_property("Start Date"),
+            "End Date": date_property("End Date"),
+            "Units": None,
+            "created_time": notion_timestamp(),
+            "last_edited_time": notion_timestamp(),
+        }
+        with self.lock:
+            self.pages[page_id] = page
+            return self.render(page)
+
+    def update(self, page_id, body):
+        with self.lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                return None
+            relation = body.get("properties", {}).get("Location")
+            if relation is not None:
+                page["Location"] = [item["id"] for item in relation["relation"]]
+            page["last_edited_time"] = notion_timestamp()
+            return self.render(page)
+
+    def retrieve(self, page_id, only=None):
+        with self.lock:
+            page = self.pages.get(page_id)
+            return self.render(page, only) if page else None
+
+    def property_items(self, page_id, property_id, start_cursor=None, page_size=100):
+        """Elementos de la relación Location de un device, paginados (GET pages/{id}/properties/{id})"""
+        with self.lock:
+            page = self.pages.get(page_id)
+            if page is None or self.property_ids(page["database_id"]).get("Location") != property_id:
+                return None
+
+            start = int(start_cursor or 0)
+            size = min(int(page_size), 100)
+            has_more = start + size < len(page["Location"])
+            return {
+                "object": "list",
+                "results": [
+                    {"object": "property_item", "id": property_id, "type": "relation", "relation": {"id": i}}
+                    for i in page["Location"][start:start + size]
+                ],
+                "has_more": has_more,
+                "next_cursor": str(start + size) if has_more else None,
+                "type": "property_item",
+                "property_item": {"id": property_id, "type": "relation", "relation": {}},
+            }
+
+    def schema(self, database_id):
+        return {
+            "object": "database",
+            "id": database_id,
+            "properties": {
+                name: {"id": property_id, "name": name}
+                for name, property_id in self.property_ids(database_id).items()
+            },
+        }
+
+
+class FakeNotionServer(ThreadingHTTPServer):
+    """Servidor HTTP con latencia, límite de ritmo y contadores configurables"""
+
+    daemon_threads = True
+
+    def __init__(self, data, port=0, latency=0.0, jitter=0.0, rate_limit=0.0, throttle=0.0):
+        super().__init__(("127.0.0.1", port), FakeNotionHandler)
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.throttle = throttle
+        self.counts = Counter()
+        self.bytes_sent = 0
+        self.stats_lock = threading.Lock()
+        self.tokens = rate_limit
+        self.tokens_updated_at = time.monotonic()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def snapshot(self):
+        """Copia de los contadores (para calcular diferencias entre etapas)"""
+        with self.stats_lock:
+            return Counter(self.counts), self.bytes_sent
+
+    def should_throttle(self):
+        """True si esta petición debe responder 429 (límite de ritmo o probabilidad)"""
+        with self.stats_lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.tokens_updated_at) * self.rate_limit)
+                self.tokens_updated_at = now
+                if self.tokens < 1:
+                    return True
+                self.tokens -= 1
+        return random.random() < self.throttle
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, extra_headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.server.stats_lock:
+            self.server.bytes_sent += len(payload)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def handle_api(self, method):
+        url = urlparse(self.path)
+        only = parse_qs(url.query).get("filter_properties")
+        body = self.read_json() if method in ("POST", "PATCH") else {}
+        server = self.server
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        if server.should_throttle():
+            with server.stats_lock:
+                server.counts["429"] += 1
+            return self.send_json(429, {"object": "error", "status": 429, "code": "rate_limited"}, {"Retry-After": "1"})
+
+        query = re.fullmatch(r"/v1/databases/([0-9a-f-]+)/query", url.path)
+        database = re.fullmatch(r"/v1/databases/([0-9a-f-]+)", url.path)
+        page = re.fullmatch(r"/v1/pages/([0-9a-f-]+)", url.path)
+        page_property = re.fullmatch(r"/v1/pages/([0-9a-f-]+)/properties/([^/]+)", url.path)
+
+        if method == "POST" and query:
+            endpoint, result = "query", server.data.query(query.group(1).replace("-", ""), body, only)
+        elif method == "POST" and url.path == "/v1/pages":
+            endpoint, result = "create", server.data.create(body)
+        elif method == "PATCH" and page:
+            endpoint, result = "update", server.data.update(page.group(1), body)
+        elif method == "GET" and page:
+            endpoint, result = "retrieve", server.data.retrieve(page.group(1), only)
+        elif method == "GET" and page_property:
+            params = parse_qs(url.query)
+            endpoint, result = "property", server.data.property_items(
+                page_property.group(1), unquote(page_property.group(2)),
+                params.get("start_cursor", [None])[0], params.get("page_size", [100])[0]
+            )
+        elif method == "GET" and database:
+            endpoint, result = "schema", server.data.schema(database.group(1).replace("-", ""))
+        else:
+            endpoint, result = "unknown", None
+
+        with server.stats_lock:
+            server.counts[endpoint] += 1
+
+        if result is None:
+            return self.send_json(404, {"object": "error", "status": 404, "code": "object_not_found"})
+        self.send_json(200, result)
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def do_PATCH(self):
+        self.handle_api("PATCH")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000, help="número de devices (1k-50k)")
+    parser.add_argument("--locations", type=int, default=None, help="número de locations (por defecto devices/10)")
+    parser.add_argument("--booked-ratio", type=float, default=0.4, help="fracción de devices con location")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--extra-properties", type=int, default=0, help="propiedades de texto que la app no lee")
+    parser.add_argument("--max-bookings", type=int, default=1, help="máximo de locations enlazadas por device reservado")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="latencia por petición (ms)")
+    parser.add_argument("--jitter", type=float, default=0, help="latencia aleatoria añadida (ms)")
+    parser.add_argument("--rate-limit", type=float, default=0, help="peticiones/s antes de responder 429 (0 = sin límite)")
+    parser.add_argument("--throttle", type=float, default=0, help="probabilidad de responder 429")
+    args = parser.parse_args()
+
+    data = FakeNotionData(
+        args.devices, args.locations, args.booked_ratio, args.seed, args.extra_properties, args.max_bookings
+    )
+    server = FakeNotionServer(
+        data, args.port, args.latency / 1000, args.jitter / 1000, args.rate_limit, args.throttle
+    )
+    print(f"Notion falso con {args.devices} devices en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
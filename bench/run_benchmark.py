@@ -0,0 +1,223 @@
+"""Benchmark de extremo a extremo de app.py contra el Notion falso (bench/fake_notion.py).
+
+Ejecuta la app sin navegador (streamlit.testing.v1.AppTest) y recorre el flujo
+real: consultar disponibilidad, filtrar por etiqueta, seleccionar dispositivos
+y asignarlos a un cliente nuevo. Para cada etapa informa de la latencia p50/p95,
+las peticiones que llegan a Notion y la memoria pico. La asignación se mide en
+dos partes: lo que espera el usuario (encolar el trabajo) y lo que tarda el
+worker en terminarlo en segundo plano.
+
+    python bench/run_benchmark.py --devices 5000 --latency 150 --runs 5
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from fake_notion import FakeNotionData, FakeNotionServer
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_PATH = REPO_DIR / "app.py"
+
+# streamlit run pone la carpeta de app.py en el path (para importar availability); AppTest no
+sys.path.insert(0, str(REPO_DIR))
+
+STAGES = ["consulta (fría)", "consulta (caché)", "filtro", "selección", "asignación", "asignación (worker)"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def find(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No se encontró el elemento '{label}'")
+
+
+def check(app):
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+
+class StageRecorder:
+    """Mide tiempo, peticiones a Notion y memoria de cada etapa"""
+
+    def __init__(self, server, trace_memory=False):
+        self.server = server
+        self.trace_memory = trace_memory
+        self.results = {stage: {"seconds": [], "requests": [], "bytes": [], "peak_mb": []} for stage in STAGES}
+
+    def measure(self, stage, action):
+        counts_before, bytes_before = self.server.snapshot()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+
+        started = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - started
+
+        counts_after, bytes_after = self.server.snapshot()
+        result = self.results[stage]
+        result["seconds"].append(elapsed)
+        result["requests"].append(sum((counts_after - counts_before).values()))
+        result["bytes"].append(bytes_after - bytes_before)
+        if self.trace_memory:
+            result["peak_mb"].append((tracemalloc.get_traced_memory()[1] - memory_before) / 2**20)
+
+
+def wait_for_updates(server, count, timeout=600):
+    """Espera a que el worker de asignaciones haya hecho `count` PATCH más"""
+    target = server.snapshot()[0]["update"] + count
+    deadline = time.monotonic() + timeout
+    while server.snapshot()[0]["update"] < target:
+        if time.monotonic() > deadline:
+            raise RuntimeError("el trabajo de asignación no terminó a tiempo")
+        time.sleep(0.02)
+
+
+def run_flow(recorder, run_number, selected_count):
+    """Un recorrido completo de la app (sesiones nuevas, caché del proceso vaciada)"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    # Primera sesión: consulta en frío (descarga completa desde Notion)
+    app = AppTest.from_file(str(APP_PATH), default_timeout=600)
+    app.run()
+    check(app)
+    recorder.measure("consulta (fría)", lambda: find(app.button, "🔍 Consultar Disponibilidad").click().run())
+    check(app)
+
+    # Segunda sesión: la misma consulta debería salir de la caché compartida
+    app = AppTest.from_file(str(APP_PATH), default_timeout=600)
+    app.run()
+    check(app)
+    recorder.measure("consulta (caché)", lambda: find(app.button, "🔍 Consultar Disponibilidad").click().run())
+    check(app)
+
+    tag_filter = find(app.multiselect, "🔎 Filtrar por etiqueta")
+    first_tag = tag_filter.options[0].rsplit(" (", 1)[0]  # las opciones llevan el recuento: "Ultra (120)"
+    recorder.measure("filtro", lambda: tag_filter.select(first_tag).run())
+    check(app)
+
+    checkboxes = list(app.checkbox)
+    recorder.measure("selección", lambda: checkboxes[0].check().run())
+    check(app)
+
+    for checkbox in list(app.checkbox)[1:selected_count]:
+        checkbox.check()
+    app.run()
+    check(app)
+
+    app.text_input(key="client_name_input").input(f"Benchmark {run_number}").run()
+    check(app)
+    selected = min(selected_count, len(checkboxes))
+    updates_before = recorder.server.snapshot()[0]["update"]
+    recorder.measure("asignación", lambda: find(app.button, "Crear y Asignar").click().run())
+    check(app)
+    done_in_click = recorder.server.snapshot()[0]["update"] - updates_before
+    recorder.measure("asignación (worker)", lambda: wait_for_updates(recorder.server, selected - done_in_click))
+
+
+def report(recorder, runs):
+    rows = []
+    for stage in STAGES:
+        result = recorder.results[stage]
+        if not result["seconds"]:
+            continue
+        rows.append({
+            "etapa": stage,
+            "p50_ms": percentile(result["seconds"], 0.5) * 1000,
+            "p95_ms": percentile(result["seconds"], 0.95) * 1000,
+            "peticiones": statistics.mean(result["requests"]),
+            "kb_recibidos": statistics.mean(result["bytes"]) / 1024,
+            "memoria_pico_mb": max(result["peak_mb"]) if result["peak_mb"] else None,
+        })
+
+    print(f"\n{'etapa':<18}{'p50 ms':>10}{'p95 ms':>10}{'peticiones':>12}{'KB':>10}{'pico MB':>10}")
+    for row in rows:
+        memory = f"{row['memoria_pico_mb']:.1f}" if row["memoria_pico_mb"] is not None else "-"
+        print(
+            f"{row['etapa']:<18}{row['p50_ms']:>10.0f}{row['p95_ms']:>10.0f}"
+            f"{row['peticiones']:>12.1f}{row['kb_recibidos']:>10.0f}{memory:>10}"
+        )
+    print(f"({runs} recorridos; memoria medida en un recorrido adicional con tracemalloc)")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000, help="número de devices (1k-50k)")
+    parser.add_argument("--locations", type=int, default=None)
+    parser.add_argument("--booked-ratio", type=float, default=0.4)
+    parser.add_argument("--extra-properties", type=int, default=0, help="propiedades que la app no lee, por página")
+    parser.add_argument("--max-bookings", type=int, default=1, help="máximo de locations enlazadas por device reservado")
+    parser.add_argument("--latency", type=float, default=100, help="latencia por petición (ms)")
+    parser.add_argument("--jitter", type=float, default=0, help="latencia aleatoria añadida (ms)")
+    parser.add_argument("--rate-limit", type=float, default=0, help="peticiones/s del Notion falso antes de responder 429")
+    parser.add_argument("--throttle", type=float, default=0, help="probabilidad de responder 429")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--select", type=int, default=10, help="dispositivos a asignar en cada recorrido")
+    parser.add_argument("--json", type=Path, default=None, help="guardar los resultados en un fichero JSON")
+    parser.add_argument(
+        "--disk-snapshot", action="store_true",
+        help="mantener la copia en disco del inventario entre recorridos (la consulta fría arranca desde disco)"
+    )
+    args = parser.parse_args()
+
+    data = FakeNotionData(
+        args.devices, args.locations, args.booked_ratio,
+        extra_properties=args.extra_properties, max_bookings=args.max_bookings
+    )
+    server = FakeNotionServer(
+        data, latency=args.latency / 1000, jitter=args.jitter / 1000,
+        rate_limit=args.rate_limit, throttle=args.throttle
+    ).start()
+
+    os.environ.setdefault("NOTION_TOKEN", "benchmark")
+    os.environ["NOTION_API_URL"] = server.base_url
+    snapshot_dir = tempfile.TemporaryDirectory()
+    os.environ["INVENTORY_SNAPSHOT_PATH"] = (
+        os.path.join(snapshot_dir.name, "inventory.sqlite") if args.disk_snapshot else ""
+    )
+    os.environ["ASSIGNMENT_JOBS_PATH"] = os.path.join(snapshot_dir.name, "jobs.sqlite")
+    os.chdir(REPO_DIR)
+
+    print(f"Notion falso: {args.devices} devices, {args.latency:.0f} ms de latencia, en {server.base_url}")
+
+    recorder = StageRecorder(server)
+    for run_number in range(args.runs):
+        run_flow(recorder, run_number, args.select)
+
+    # Pasada extra solo para memoria (tracemalloc ralentiza y falsearía las latencias)
+    memory_recorder = StageRecorder(server, trace_memory=True)
+    tracemalloc.start()
+    run_flow(memory_recorder, args.runs, args.select)
+    tracemalloc.stop()
+    for stage in STAGES:
+        recorder.results[stage]["peak_mb"] = memory_recorder.results[stage]["peak_mb"]
+
+    rows = report(recorder, args.runs)
+    if args.json:
+        args.json.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "stages": rows}, indent=2))
+
+    server.shutdown()
+    snapshot_dir.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
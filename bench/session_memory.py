@@ -0,0 +1,109 @@
+"""Memoria propia de cada sesión inactiva de app.py, contra el Notion falso.
+
+Abre varias sesiones con AppTest que hacen la misma consulta y seleccionan
+algunos dispositivos, y mide lo que cada sesión retiene en st.session_state sin
+compartirlo con las demás (los objetos alcanzables desde otra sesión, como los
+registros del inventario o los resultados compartidos, no cuentan).
+
+    python bench/session_memory.py --devices 5000 --sessions 3
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+from fake_notion import FakeNotionData, FakeNotionServer
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_PATH = REPO_DIR / "app.py"
+
+# streamlit run pone la carpeta de app.py en el path (para importar availability); AppTest no
+sys.path.insert(0, str(REPO_DIR))
+
+# Se paran aquí: son código, no datos de la sesión
+OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def session_values(app):
+    state = app.session_state._state
+    return [state[key] for key in state.filtered_state]
+
+
+def reachable(roots):
+    """Objetos alcanzables desde roots (por id), sin entrar en clases, módulos ni funciones"""
+    seen = {}
+    pending = list(roots)
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, OPAQUE_TYPES):
+            continue
+        seen[id(obj)] = obj
+        pending.extend(gc.get_referents(obj))
+    return seen
+
+
+def own_bytes(session, others):
+    """Bytes de los objetos de session que no alcanza ninguna de las otras sesiones"""
+    shared = set()
+    for other in others:
+        shared.update(reachable(session_values(other)))
+    return sum(sys.getsizeof(obj) for key, obj in reachable(session_values(session)).items() if key not in shared)
+
+
+def find(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No se encontró el elemento '{label}'")
+
+
+def open_session(selected):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(APP_PATH), default_timeout=600)
+    app.run()
+    find(app.button, "🔍 Consultar Disponibilidad").click().run()
+    for checkbox in list(app.checkbox)[:selected]:
+        checkbox.check()
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--sessions", type=int, default=3)
+    parser.add_argument("--select", type=int, default=10, help="dispositivos seleccionados en cada sesión")
+    args = parser.parse_args()
+
+    server = FakeNotionServer(FakeNotionData(args.devices)).start()
+    os.environ.setdefault("NOTION_TOKEN", "benchmark")
+    os.environ["NOTION_API_URL"] = server.base_url
+    os.environ["NOTION_RATE_LIMIT"] = "1000"
+    os.environ["INVENTORY_SNAPSHOT_PATH"] = ""
+    jobs_dir = tempfile.TemporaryDirectory()
+    os.environ["ASSIGNMENT_JOBS_PATH"] = os.path.join(jobs_dir.name, "jobs.sqlite")
+    os.chdir(REPO_DIR)
+
+    sessions = [open_session(args.select) for _ in range(args.sessions)]
+    sizes = [
+        own_bytes(session, sessions[:number] + sessions[number + 1:])
+        for number, session in enumerate(sessions)
+    ]
+
+    print(f"{args.devices} devices, {args.sessions} sesiones inactivas con {args.select} seleccionados")
+    for number, size in enumerate(sizes):
+        print(f"  sesión {number + 1}: {size / 1024:.1f} KB propios")
+    print(f"media: {sum(sizes) / len(sizes) / 1024:.1f} KB por sesión")
+
+    server.shutdown()
+    jobs_dir.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
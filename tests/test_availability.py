@@ -0,0 +1,167 @@
+"""Paridad de los motores de disponibilidad (AvailabilityIndex y VectorAvailability) con check_availability"""
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import pytest
+
+from availability import (
+    AvailabilityIndex, VectorAvailability, check_availability, clashing_reservations, join_bookings, location_interval
+)
+
+TODAY = date(2025, 6, 15)
+
+
+@dataclass(frozen=True)
+class Device:
+    id: str
+    tag_code: int
+    location_ids: tuple
+
+    @property
+    def tag(self):
+        return f"tag {self.tag_code}"
+
+
+def location(start=None, end=None):
+    return {"start": start, "end": end}
+
+
+def expected_available(devices, bookings, start_date, end_date):
+    return [
+        device for device, device_bookings in zip(devices, bookings)
+        if check_availability(device_bookings, start_date, end_date)
+    ]
+
+
+def assert_engines_agree(devices, locations_by_id, date_ranges):
+    """Los dos motores devuelven lo mismo que check_availability en cada rango"""
+    bookings = join_bookings(devices, locations_by_id)
+    index = AvailabilityIndex(devices, bookings)
+    vector = VectorAvailability(devices, bookings)
+    matrix = vector.availability_matrix(date_ranges)
+
+    for row, (start_date, end_date) in enumerate(date_ranges):
+        expected = expected_available(devices, bookings, start_date, end_date)
+        assert index.available(start_date, end_date) == expected, (start_date, end_date)
+        assert vector.available(start_date, end_date) == expected, (start_date, end_date)
+        assert [device for device, free in zip(devices, matrix[row]) if free] == expected, (start_date, end_date)
+
+
+# Una location enlazada y el día que se consulta: (location, día, ¿libre?)
+EDGE_CASES = {
+    "sin fechas": (location(), TODAY, False),
+    "fecha de inicio inválida": (location("2025-13-45", "2025-06-20"), TODAY + timedelta(days=100), False),
+    "fecha de fin inválida": (location("2025-06-10", "mañana"), TODAY - timedelta(days=100), False),
+    "solo inicio, antes": (location("2025-06-20"), TODAY, True),
+    "solo inicio, el mismo día": (location("2025-06-15"), TODAY, False),
+    "solo inicio, después": (location("2025-06-01"), date(9999, 12, 31), False),
+    "solo fin, antes": (location(None, "2025-06-14"), TODAY, True),
+    "solo fin, el mismo día": (location(None, "2025-06-15"), TODAY, False),
+    "solo fin, mucho antes": (location(None, "2025-06-20"), date(1, 1, 1), False),
+    "empieza al día siguiente": (location("2025-06-16", "2025-06-20"), TODAY, True),
+    "termina el día anterior": (location("2025-06-10", "2025-06-14"), TODAY, True),
+    "cubre el día": (location("2025-06-15", "2025-06-15"), TODAY, False),
+}
+
+
+@pytest.mark.parametrize("case", EDGE_CASES.values(), ids=EDGE_CASES.keys())
+def test_edge_cases(case):
+    booked, day, free = case
+    devices = [Device("booked", 0, ("loc",)), Device("free", 1, ())]
+    locations_by_id = {"loc": booked}
+
+    bookings = join_bookings(devices, locations_by_id)
+    assert check_availability(bookings[0], day, day) is free
+    assert check_availability(bookings[1], day, day) is True
+    date_ranges = [(day, day)]
+    if day > date.min:
+        date_ranges.append((day - timedelta(days=1), day))
+    if day < date.max:
+        date_ranges.append((day, day + timedelta(days=1)))
+    assert_engines_agree(devices, locations_by_id, date_ranges)
+
+
+def test_unknown_location_is_busy():
+    devices = [Device("a", 0, ("borrada",))]
+    assert join_bookings(devices, {}) == [((date.min, date.max),)]
+    assert_engines_agree(devices, {}, [(TODAY, TODAY), (date.min, date.min), (date.max, date.max)])
+
+
+def test_free_between_bookings():
+    devices = [Device("a", 0, ("julio", "mayo"))]
+    locations_by_id = {"mayo": location("2025-05-01", "2025-05-31"), "julio": location("2025-07-01", "2025-07-31")}
+
+    bookings = join_bookings(devices, locations_by_id)
+    assert check_availability(bookings[0], date(2025, 6, 1), date(2025, 6, 30))
+    assert not check_availability(bookings[0], date(2025, 6, 1), date(2025, 7, 1))
+    assert_engines_agree(devices, locations_by_id, [
+        (date(2025, 6, 1), date(2025, 6, 30)),
+        (date(2025, 5, 31), date(2025, 6, 5)),
+        (date(2025, 6, 25), date(2025, 7, 1)),
+        (date(2025, 4, 1), date(2025, 8, 31)),
+    ])
+
+
+def test_empty_inventory():
+    assert_engines_agree([], {}, [(TODAY, TODAY)])
+    assert_engines_agree([Device("a", 0, ()), Device("b", 1, ())], {}, [(date.min, date.max)])
+
+
+def random_date(rnd):
+    return TODAY + timedelta(days=rnd.randint(-90, 90))
+
+
+def random_location(rnd):
+    """Location con fechas, sin alguna de ellas o con alguna inválida"""
+    start = random_date(rnd)
+    end = start + timedelta(days=rnd.randint(0, 30))
+    kind = rnd.random()
+    if kind < 0.05:
+        return location()
+    if kind < 0.1:
+        return location("31/12/2025", end.isoformat())
+    if kind < 0.2:
+        return location(start.isoformat())
+    if kind < 0.3:
+        return location(None, end.isoformat())
+    return location(start.isoformat(), end.isoformat())
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_inventories(seed):
+    rnd = random.Random(seed)
+    locations_by_id = {f"loc{number}": random_location(rnd) for number in range(60)}
+    # Algunos devices enlazan locations que no están en la copia local
+    location_ids = [*locations_by_id, "borrada1", "borrada2"]
+    devices = [
+        Device(f"dev{number}", rnd.randrange(4), tuple(rnd.sample(location_ids, rnd.choice([0, 0, 1, 1, 2, 3, 6]))))
+        for number in range(300)
+    ]
+
+    date_ranges = [(date.min, date.max), (date.min, TODAY), (TODAY, date.max)]
+    for _ in range(100):
+        start_date = random_date(rnd)
+        date_ranges.append((start_date, start_date + timedelta(days=rnd.randint(0, 20))))
+
+    assert_engines_agree(devices, locations_by_id, date_ranges)
+
+
+def test_free_counts_by_tag():
+    devices = [Device("a", 0, ()), Device("b", 0, ("loc",)), Device("c", 1, ())]
+    vector = VectorAvailability(devices, join_bookings(devices, {"loc": location("2025-06-10", "2025-06-20")}))
+
+    counts = vector.free_counts_by_tag([(TODAY, TODAY), (date(2025, 7, 1), date(2025, 7, 2))])
+    assert counts.to_dict(orient="list") == {"tag 0": [1, 2], "tag 1": [1, 1]}
+
+
+def test_past_booking_does_not_clash_with_in_house_from_today():
+    # Ubicación In House que empezó hace 400 días; el device tuvo un evento que terminó hace 35
+    in_house = location_interval(location((TODAY - timedelta(days=400)).isoformat()))
+    past_event = ("Evento pasado", (TODAY - timedelta(days=40), TODAY - timedelta(days=35)))
+
+    # La reserva que se crea va desde la fecha de inicio elegida, no desde el inicio de la location
+    assert clashing_reservations([past_event], TODAY, date.max) == []
+    assert clashing_reservations([past_event], *in_house) == ["Evento pasado"]
+    future_event = ("Evento futuro", (TODAY + timedelta(days=3), TODAY + timedelta(days=5)))
+    assert clashing_reservations([past_event, future_event], TODAY, date.max) == ["Evento futuro"]